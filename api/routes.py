@@ -1,29 +1,37 @@
-from datetime import datetime
-
 import jwt
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
-from app.config import SECRET_KEY, ALGORITHM
+from app.config import SECRET_KEY, ALGORITHM, SIMILAR_EVENTS_NEIGHBOURS, NEIGHBOURS_QUALITY_MAX_SAMPLE
 from app.dependencies import verify_token, verify_token_easy
 from app.models import FirebaseLoginRequest, EventUpdateRequest
-from recommendation.user_profile import build_profile_vector, update_profile_vector, get_similar_to_last_liked
-from services.fetcher import fetch_and_store_events
-from services.firestore_client import delete_expired_events, set_last_manual_sync_time
-from recommendation.recommendation_engine import get_recommendations
+from recommendation.user_profile import build_profile_vector_async, update_profile_vector_async, \
+    get_similar_to_last_liked_async
+from app.scheduler import run_sync, run_cleanup
+from services.jobs import job_manager
+from recommendation.recommendation_engine import get_recommendations_async
+from recommendation.cache import recommendation_cache
+from recommendation.event_index import get_event_index
+from recommendation.neighbours import compare_neighbours
 
 router = APIRouter()
 
 # -------------------------- EVENTS UPDATES
-@router.post("/sync", dependencies=[Depends(verify_token_easy)])
+@router.post("/sync", status_code=202, dependencies=[Depends(verify_token_easy)])
 def manual_sync():
-    fetch_and_store_events()
-    set_last_manual_sync_time(datetime.now())
-    return {"status": "Manual sync complete"}
+    job, created = job_manager.submit("sync", lambda progress: run_sync(progress, manual=True))
+    return {"status": "Manual sync started" if created else "Sync already running", "job_id": job.id}
 
-@router.post("/cleanup", dependencies=[Depends(verify_token_easy)])
+@router.post("/cleanup", status_code=202, dependencies=[Depends(verify_token_easy)])
 def manual_cleanup():
-    delete_expired_events()
-    return {"status": "Expired events deleted"}
+    job, created = job_manager.submit("cleanup", run_cleanup)
+    return {"status": "Cleanup started" if created else "Cleanup already running", "job_id": job.id}
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(verify_token_easy)])
+def job_status(job_id: str):
+    status = job_manager.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
 
 # -------------------------- USER UPDATES
 @router.post("/auth/firebase-login")
@@ -35,27 +43,42 @@ def firebase_login(data: FirebaseLoginRequest):
 
 
 @router.post("/user/init_profile", dependencies=[Depends(verify_token)])
-def init_user_profile(request: Request):
+async def init_user_profile(request: Request):
     user_id = request.state.user_id
-    build_profile_vector(user_id)
+    await build_profile_vector_async(user_id)
     return {"status": "User profile initialized"}
 
 @router.post("/user/update_profile", dependencies=[Depends(verify_token)])
-def update_user_profile(request: Request, body: EventUpdateRequest):
+async def update_user_profile(request: Request, body: EventUpdateRequest):
     user_id = request.state.user_id
-    update_profile_vector(user_id, body.event_id)
+    await update_profile_vector_async(user_id, body.event_id)
     return {"status": "Profile updated"}
 
 @router.get("/user/get_recommendations", dependencies=[Depends(verify_token)])
-def get_user_recommendations(request: Request):
+async def get_user_recommendations(request: Request):
     user_id = request.state.user_id
-    recommendations = get_recommendations(user_id)
+    recommendations = await get_recommendations_async(user_id)
     return {"recommendations": recommendations}
 
+@router.get("/recommendations/cache_stats", dependencies=[Depends(verify_token_easy)])
+def recommendation_cache_stats():
+    # лічильники окремого воркера
+    return recommendation_cache.stats()
+
+@router.post("/recommendations/neighbours_quality", status_code=202, dependencies=[Depends(verify_token_easy)])
+def neighbours_quality(top_n: int = Query(10, ge=1, le=SIMILAR_EVENTS_NEIGHBOURS),
+                       sample_size: int = Query(200, ge=1, le=NEIGHBOURS_QUALITY_MAX_SAMPLE)):
+    # повний перебір для кожної події вибірки - у фоновій задачі, результат через /jobs/{job_id}
+    job, created = job_manager.submit(
+        "neighbours_quality",
+        lambda progress: compare_neighbours(get_event_index(), top_n=top_n, sample_size=sample_size))
+    return {"status": "Neighbours check started" if created else "Neighbours check already running",
+            "job_id": job.id}
+
 @router.get("/user/get_similar_events", dependencies=[Depends(verify_token)])
-def get_similar_events(request: Request):
+async def get_similar_events(request: Request):
     user_id = request.state.user_id
-    similar, last_fav_id = get_similar_to_last_liked(user_id)
+    similar, last_fav_id = await get_similar_to_last_liked_async(user_id)
     return {"similar": similar,
             "lastLikedEventId": last_fav_id}
 
@@ -1,6 +1,5 @@
 import os
 
-import joblib
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -20,18 +19,85 @@ EVENTS_API_URL = os.getenv("RAPID_API_URL")
 SCHEDULE_INTERVAL_HOURS = int(os.getenv("SCHEDULE_INTERVAL_HOURS", 6))
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 RAPIDAPI_HOST = os.getenv("RAPIDAPI_HOST")
+RAPIDAPI_REQUESTS_PER_SECOND = float(os.getenv("RAPIDAPI_REQUESTS_PER_SECOND", 5))
+RAPIDAPI_MAX_RETRIES = int(os.getenv("RAPIDAPI_MAX_RETRIES", 3))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", 8))
+# потоковий конвеєр синхронізації: розмір черг між етапами (у сторінках), воркери етапів, мікробатчі запису
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 8))
+PIPELINE_CATEGORIZE_WORKERS = int(os.getenv("PIPELINE_CATEGORIZE_WORKERS", 1))
+PIPELINE_TRANSLATE_WORKERS = int(os.getenv("PIPELINE_TRANSLATE_WORKERS", 2))
+PIPELINE_VECTORIZE_WORKERS = int(os.getenv("PIPELINE_VECTORIZE_WORKERS", 1))
+PIPELINE_WRITE_BATCH = int(os.getenv("PIPELINE_WRITE_BATCH", 100))
+PIPELINE_FLUSH_SECONDS = float(os.getenv("PIPELINE_FLUSH_SECONDS", 5))
+PIPELINE_CHECKPOINT_PATH = os.path.abspath(os.getenv(
+    "PIPELINE_CHECKPOINT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.cache/sync_checkpoint.json")))
+PIPELINE_CHECKPOINT_MAX_AGE_HOURS = int(os.getenv("PIPELINE_CHECKPOINT_MAX_AGE_HOURS", 12))
 
 # app
 SCHEDULE_DELETE_INTERVAL_HOURS = int(os.getenv("SCHEDULE_DELETE_INTERVAL_HOURS", 24))
+# планувальник запускається лише у воркері, що тримає цей файловий lock (один на хост)
+SCHEDULER_LOCK_PATH = os.path.abspath(os.getenv(
+    "SCHEDULER_LOCK_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.cache/scheduler.lock")))
 SECRET_KEY = os.getenv("SECRET_KEY")
 API_KEY_NAME = os.getenv("API_KEY_NAME")
 ALGORITHM = os.getenv("ALGORITHM")
 
+# локальний емулятор Firestore (gcloud emulators firestore start), напр. для офлайн бенчмарків
+FIRESTORE_EMULATOR_HOST = os.getenv("FIRESTORE_EMULATOR_HOST")
+FIRESTORE_PROJECT_ID = os.getenv("FIRESTORE_PROJECT_ID", "festigo-local")
+FIRESTORE_BATCH_SIZE = int(os.getenv("FIRESTORE_BATCH_SIZE", 500))
+FIRESTORE_WRITE_WORKERS = int(os.getenv("FIRESTORE_WRITE_WORKERS", 4))
+FIRESTORE_MAX_RETRIES = int(os.getenv("FIRESTORE_MAX_RETRIES", 3))
+
 SETTINGS_COLLECTION = "app_settings"
 DOC_ID = "scheduler_meta"
+# версія каталогу подій (індексу), яку має мати кожен процес; оновлюється після sync і cleanup
+CATALOGUE_DOC_ID = "event_catalogue"
+FEATURE_SPACE_DOC_ID = "feature_space"
+# фонові задачі (/sync, /cleanup): lease у Firestore не дає двом процесам запустити одну задачу одночасно
+JOB_LEASE_MINUTES = int(os.getenv("JOB_LEASE_MINUTES", 120))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", 50))
+# як часто стан задачі (прогрес) записується у Firestore, щоб /jobs/{id} бачили всі воркери
+JOB_PROGRESS_SECONDS = int(os.getenv("JOB_PROGRESS_SECONDS", 10))
+
+# recommendations
+# як часто процес звіряє свій індекс подій з версією каталогу у Firestore
+EVENT_INDEX_CHECK_SECONDS = int(os.getenv("EVENT_INDEX_CHECK_SECONDS", 60))
+# скільки схожих подій зберігати для кожної події при побудові індексу
+SIMILAR_EVENTS_NEIGHBOURS = int(os.getenv("SIMILAR_EVENTS_NEIGHBOURS", 20))
+# найбільша вибірка для перевірки якості сусідів (кожна подія вибірки - повний перебір)
+NEIGHBOURS_QUALITY_MAX_SAMPLE = int(os.getenv("NEIGHBOURS_QUALITY_MAX_SAMPLE", 1000))
+# спільна для всіх воркерів копія індексу подій (.npy, відкривається через mmap)
+EVENT_INDEX_DIR = os.path.abspath(os.getenv(
+    "EVENT_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.cache/event_index")))
+# "r" - моделі відкриваються через mmap (спільні сторінки між воркерами), порожнє значення - звичайне завантаження
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r") or None
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 10_000))
+RECOMMENDATION_CACHE_TTL_MINUTES = int(os.getenv("RECOMMENDATION_CACHE_TTL_MINUTES", 60))
+# зберігати пораховані на запит рекомендації і в документі користувача, щоб їх бачили всі воркери
+RECOMMENDATION_CACHE_PERSIST = os.getenv("RECOMMENDATION_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+LAST_ACTIVE_UPDATE_MINUTES = int(os.getenv("LAST_ACTIVE_UPDATE_MINUTES", 60))
+# передрахунок рекомендацій після синхронізації для користувачів, активних за останні N днів
+PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("PRECOMPUTE_ACTIVE_DAYS", 7))
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", 2))
+PRECOMPUTE_TOP_N = int(os.getenv("PRECOMPUTE_TOP_N", 20))
 
 # translate
 GEMINI_API_KEY = os.getenv("GEMINI_TOKEN")
+GEMINI_REQUESTS_PER_MIN = float(os.getenv("GEMINI_REQUESTS_PER_MIN", 15))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", 2))
+# deep_translator (Google Translate) - окремі ліміти
+TRANSLATOR_CONCURRENCY = int(os.getenv("TRANSLATOR_CONCURRENCY", 4))
+TRANSLATOR_REQUESTS_PER_SECOND = float(os.getenv("TRANSLATOR_REQUESTS_PER_SECOND", 5))
+# потоки для паралельного transform_events
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", 8))
+GEMINI_BATCH_EVENTS = int(os.getenv("GEMINI_BATCH_EVENTS", 20))
+GEMINI_BATCH_MAX_CHARS = int(os.getenv("GEMINI_BATCH_MAX_CHARS", 10000))
+TRANSLATION_CACHE_PATH = os.path.abspath(os.getenv(
+    "TRANSLATION_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.cache/translations.sqlite3")))
+TRANSLATION_CACHE_TTL_DAYS = int(os.getenv("TRANSLATION_CACHE_TTL_DAYS", 90))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 100_000))
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -40,12 +106,17 @@ genre_model_path = os.path.join(BASE_DIR, "../categorization/models/genre_model.
 genre_mlb_path = os.path.join(BASE_DIR, "../categorization/models/genre_mlb.joblib")
 category_model_path = os.path.join(BASE_DIR, "../categorization/models/category_model_multi.joblib")
 category_mlb_path = os.path.join(BASE_DIR, "../categorization/models/category_mlb.joblib")
+# простір ознак зберігається у Firestore (спільний для всіх інстансів), тут - лише локальна копія кожної версії
+FEATURE_SPACE_CACHE_DIR = os.path.abspath(os.getenv(
+    "FEATURE_SPACE_CACHE_DIR", os.path.join(BASE_DIR, "../.cache/feature_space")))
+# як часто процес звіряє свій простір ознак з версією у Firestore
+FEATURE_SPACE_CHECK_SECONDS = int(os.getenv("FEATURE_SPACE_CHECK_SECONDS", 60))
+# після синхронізації простір ознак перенавчається на всьому каталозі, якщо каталог виріс у N разів
+# від моменту навчання або простору більше ніж N днів
+FEATURE_SPACE_REFIT_GROWTH = float(os.getenv("FEATURE_SPACE_REFIT_GROWTH", 1.5))
+FEATURE_SPACE_REFIT_DAYS = int(os.getenv("FEATURE_SPACE_REFIT_DAYS", 7))
 
-# Завантаження моделей
-genre_model = joblib.load(os.path.abspath(genre_model_path))
-genre_mlb = joblib.load(os.path.abspath(genre_mlb_path))
-category_model = joblib.load(os.path.abspath(category_model_path))
-category_mlb = joblib.load(os.path.abspath(category_mlb_path))
+# моделі завантажуються ліниво: categorization/model_registry.py
 
 
 # Категорії
@@ -86,7 +157,8 @@ GENRES = {
     "show": ["comedy", "drama", "tragicomedy", "ballet", "musical", "stand-up", "opera", "monodrama"],
     "cinema": ["thriller", "horror", "drama", "action", "sci-fi", "documentary", "romance", "animation"]
 }
-ALL_GENRES = list({genre for genres in GENRES.values() for genre in genres}) + ['other']
+# sorted, щоб порядок не залежав від хешування рядків у процесі
+ALL_GENRES = sorted({genre for genres in GENRES.values() for genre in genres}) + ['other']
 
 
 IMPLICIT_GENRE_HINTS = {
@@ -221,3 +293,29 @@ city_translation_map = {
     "Busk": "Буськ",
     "Vynnyky": "Винники",
 }
+
+
+# транслітеровані відмінкові форми, які трапляються в назвах подій ("u Lvovi", "z Kyieva")
+city_inflected_forms = {
+    "Kyieva": "Києва",
+    "Kyievi": "Києві",
+    "Kyievom": "Києвом",
+    "Lvova": "Львова",
+    "Lvovi": "Львові",
+    "Kharkova": "Харкова",
+    "Kharkovi": "Харкові",
+    "Odesy": "Одеси",
+    "Odesi": "Одесі",
+    "Dnipra": "Дніпра",
+    "Dnipri": "Дніпрі",
+    "Vinnytsi": "Вінниці",
+    "Poltavy": "Полтави",
+    "Poltavi": "Полтаві",
+    "Ternopolia": "Тернополя",
+    "Ternopoli": "Тернополі",
+    "Chernihova": "Чернігова",
+    "Chernihovi": "Чернігові",
+    "Zaporizhzhi": "Запоріжжі",
+    "Uzhhoroda": "Ужгорода",
+    "Uzhhorodi": "Ужгороді",
+}
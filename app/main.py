@@ -2,6 +2,9 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from app.scheduler import start_scheduler
+from categorization.model_registry import models
+from recommendation.event_index import get_event_index
+from services.firestore_client import db
 from api.routes import router as api_router
 
 # pip freeze > requirements.txt
@@ -12,6 +15,9 @@ from api.routes import router as api_router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # при старті
+    models.preload()
+    db.client()
+    get_event_index()
     start_scheduler()
 
     yield
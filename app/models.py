@@ -14,6 +14,11 @@ class Venue(BaseModel):
     longitude: float
     subtypes: List[str] = []
 
+class SparseVector(BaseModel):
+    dim: int
+    indices: List[int]
+    values: List[float]
+
 class Event(BaseModel):
     id: str
     name: str
@@ -37,7 +42,10 @@ class Event(BaseModel):
 
     country: str
     price: Optional[str] = "-"
-    component_vectors: Optional[Dict[str, List[float]]] = None
+    component_vectors: Optional[Dict[str, SparseVector]] = None
+    vector_version: Optional[str] = None
+    # хеш сирих даних RapidAPI, за яким синхронізація пропускає незмінені події
+    source_hash: Optional[str] = None
 
 class FirebaseLoginRequest(BaseModel):
     user_id: str
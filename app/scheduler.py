@@ -1,16 +1,54 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: планувальник запускається в кожному процесі
+    fcntl = None
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from services.fetcher import fetch_and_store_events
-from services.firestore_client import delete_expired_events, get_last_manual_sync_time
-from app.config import SCHEDULE_INTERVAL_HOURS, SCHEDULE_DELETE_INTERVAL_HOURS
+from services.firestore_client import delete_expired_events, get_last_manual_sync_time, set_last_manual_sync_time
+from services.jobs import job_manager
+from recommendation.event_index import refresh_event_index
+from recommendation.precompute import precompute_recommendations
+from app.config import SCHEDULE_INTERVAL_HOURS, SCHEDULE_DELETE_INTERVAL_HOURS, SCHEDULER_LOCK_PATH
 from datetime import datetime, timedelta
 
 SKIP_SYNC_FOR_HOURS = 24 * 30
 
+scheduler = BackgroundScheduler()
+# відкритий файл lock-а живе, поки живе процес; після падіння воркера lock отримує його заміна
+_scheduler_lock = None
+
+def acquire_scheduler_lock(path: str = SCHEDULER_LOCK_PATH) -> bool:
+    """
+    takes the host-wide scheduler lock without waiting; held until the process exits
+    """
+    global _scheduler_lock
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_file = open(path, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _scheduler_lock = lock_file
+    return True
+
 def start_scheduler():
-    scheduler = BackgroundScheduler()
+    """
+    starts APScheduler in one worker per host; between hosts (replicas) the job leases
+    in Firestore keep a sync or cleanup from running twice
+    """
+    if not acquire_scheduler_lock():
+        print(f"[Scheduler] ⏭ Scheduler runs in another worker (pid {os.getpid()} skips it).")
+        return
     scheduler.add_job(scheduled_sync, 'interval', hours=SCHEDULE_INTERVAL_HOURS)
-    scheduler.add_job(delete_expired_events, 'interval', hours=SCHEDULE_DELETE_INTERVAL_HOURS)
+    scheduler.add_job(scheduled_cleanup, 'interval', hours=SCHEDULE_DELETE_INTERVAL_HOURS)
     scheduler.start()
+    print(f"[Scheduler] ▶️ Scheduler started in worker {os.getpid()}.")
 
 def scheduled_sync():
     last_sync = get_last_manual_sync_time()
@@ -21,4 +59,37 @@ def scheduled_sync():
         return
 
     print("[Scheduler] 🔁 Running scheduled sync.")
-    fetch_and_store_events()
+    job_manager.run("sync", run_sync)
+
+def scheduled_cleanup():
+    job_manager.run("cleanup", run_cleanup)
+
+def run_sync(progress: dict, manual: bool = False) -> dict:
+    """
+    sync job body; `progress` gets the pipeline counters while it runs
+    """
+    report = fetch_and_store_events(progress)
+    if manual:
+        set_last_manual_sync_time(datetime.now())
+    submit_precompute()
+    return report
+
+def run_cleanup(progress: dict) -> dict:
+    """
+    cleanup job body; `progress` gets the stage and counters while it runs
+    """
+    report = delete_expired_events(progress)
+    if report["deleted"]:
+        progress["stage"] = "refreshing_index"
+        refresh_event_index()
+    return report
+
+def submit_precompute():
+    """
+    queues recommendation precomputation as its own job: one at a time across workers (lease),
+    its state is visible through /jobs/{job_id}
+    """
+    job, created = job_manager.submit("precompute", precompute_recommendations)
+    if not created:
+        print(f"[Scheduler] ⏭ Precompute {job.id} is already running.")
+    return job
@@ -1,6 +1,7 @@
 from typing import Dict, List, Tuple
 import json
-from app.config import CATEGORY_KEYWORDS, genre_model, category_model, category_mlb, genre_mlb
+from app.config import CATEGORY_KEYWORDS
+from categorization.model_registry import models
 import re
 from urllib.parse import urlparse
 
@@ -32,78 +33,139 @@ def preprocess_text(*texts: List[str]) -> str:
 
 
 
-def detect_genres(event: Dict, main_categories: List[str]) -> List[str]:
-    applicable = {"music", "cinema", "show"}
-    if not any(cat in applicable for cat in main_categories):
-        return []
-
-    text = preprocess_text(
+def event_text(event: Dict) -> str:
+    venue = event.get("venue") or {}
+    return preprocess_text(
         event.get("name", ""),
         event.get("description", ""),
         event.get("link", ""),
-        event.get("venue", {}).get("name", ""),
+        venue.get("name", ""),
         event.get("publisher", ""),
-        ' '.join(event.get("venue", {}).get("subtypes") or [])
+        ' '.join(venue.get("subtypes") or [])
     )
 
-    scores = genre_model.decision_function([text])[0]
-    genres = genre_mlb.classes_
 
-    detected = [genre for genre, score in zip(genres, scores) if score > 0]
+def detect_genres(event: Dict, main_categories: List[str]) -> List[str]:
+    return detect_genres_batch([event_text(event)], [main_categories])[0]
+
+
+def detect_genres_batch(texts: List[str], main_categories: List[List[str]]) -> List[List[str]]:
+    """
+    genres for many events; the genre model runs once on all events with a music/cinema/show category
+    """
+    applicable = {"music", "cinema", "show"}
+    results = [[] for _ in texts]
+    rows = [i for i, cats in enumerate(main_categories) if any(cat in applicable for cat in cats)]
+    if not rows:
+        return results
+
+    scores = models.get("genre_model").decision_function([texts[i] for i in rows])
+    genres = models.get("genre_mlb").classes_
+
+    for i, row_scores in zip(rows, scores):
+        detected = [genre for genre, score in zip(genres, row_scores) if score > 0]
+        results[i] = sorted(set(detected))
+
+    return results
+
+
+class KeywordMatcher:
+    """
+    all CATEGORY_KEYWORDS compiled into one word-bounded alternation, scanned once per text.
+
+    the lookahead reports the longest keyword starting at every position; shorter keywords that
+    match at the same position are its prefixes ending on a word boundary and are resolved from a
+    precomputed table, so the set of found keywords equals running re.search for every keyword.
+    """
+
+    def __init__(self, category_keywords: Dict[str, Dict[str, float]]):
+        self.category_keywords = category_keywords
+        keywords = sorted({k for kws in category_keywords.values() for k in kws}, key=len, reverse=True)
+        self.pattern = re.compile(r"(?=\b(" + "|".join(re.escape(k) for k in keywords) + r")\b)")
+        self.prefixes = {
+            keyword: [p for p in keywords if p != keyword and re.match(rf"{re.escape(p)}\b", keyword)]
+            for keyword in keywords
+        }
+
+    def find_keywords(self, text: str) -> set:
+        found = set()
+        for match in self.pattern.finditer(text):
+            keyword = match.group(1)
+            if keyword not in found:
+                found.add(keyword)
+                found.update(self.prefixes[keyword])
+        return found
+
+    def scores(self, text: str) -> Dict[str, float]:
+        found = self.find_keywords(text)
+        keyword_scores = {}
+        for category, keywords in self.category_keywords.items():
+            score = 0.0
+            for keyword, weight in keywords.items():
+                if keyword in found:
+                    score += weight
+            if score > 0:
+                keyword_scores[category] = round(score, 3)
+        return keyword_scores
 
-    return sorted(set(detected))
+
+keyword_matcher = KeywordMatcher(CATEGORY_KEYWORDS)
+
+
+def keyword_scores_for_text(text: str) -> Dict[str, float]:
+    return keyword_matcher.scores(text)
 
 
 def categorize_event(event: Dict) -> List[Tuple[str, float]]:
-    text = preprocess_text(
-        event.get("name", ""),
-        event.get("description", ""),
-        event.get("link", ""),
-        event.get("venue", {}).get("name", ""),
-        event.get("publisher", ""),
-        ' '.join(event.get("venue", {}).get("subtypes") or [])
-    )
+    return categorize_texts([event_text(event)])[0]
+
+
+def categorize_texts(texts: List[str]) -> List[List[Tuple[str, float]]]:
+    """
+    category scores for many preprocessed texts; the category model runs once on the stacked batch
+    """
+    if not texts:
+        return []
 
     # --- Model scores ---
-    model_scores_raw = category_model.decision_function([text])[0]
-    model_categories = category_mlb.classes_
-    model_scores = {cat: float(score) for cat, score in zip(model_categories, model_scores_raw) if score > 0}
-
-    # --- Keyword scores ---
-    keyword_scores = {}
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        score = 0.0
-        for keyword, weight in keywords.items():
-            if re.search(rf"\b{re.escape(keyword)}\b", text):
-                score += weight
-        if score > 0:
-            keyword_scores[category] = round(score, 3)
-
-    # --- Combined ---
-    combined_scores = {}
-    for category in set(model_scores) | set(keyword_scores):
-        score_model = model_scores.get(category, 0)
-        score_keyword = keyword_scores.get(category, 0)
-        combined_scores[category] = round(0.3 * score_model + 0.7 * score_keyword, 3)
-
-    return sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
+    model_scores_raw = models.get("category_model").decision_function(texts)
+    model_categories = models.get("category_mlb").classes_
+
+    results = []
+    for text, row_scores in zip(texts, model_scores_raw):
+        model_scores = {cat: float(score) for cat, score in zip(model_categories, row_scores) if score > 0}
+
+        # --- Keyword scores ---
+        keyword_scores = keyword_scores_for_text(text)
+
+        # --- Combined ---
+        combined_scores = {}
+        for category in set(model_scores) | set(keyword_scores):
+            score_model = model_scores.get(category, 0)
+            score_keyword = keyword_scores.get(category, 0)
+            combined_scores[category] = round(0.3 * score_model + 0.7 * score_keyword, 3)
+
+        results.append(sorted(combined_scores.items(), key=lambda x: x[1], reverse=True))
+
+    return results
 
 
 def assign_categories_to_events(events: List[Dict]) -> List[Dict]:
-    enriched_events = []
+    texts = [event_text(event) for event in events]
+    all_main_categories = []
 
-    for event in events:
-        categories = categorize_event(event)
+    for event, categories in zip(events, categorize_texts(texts)):
         categories_dicts = [{"category": cat, "score": score} for cat, score in categories]
         event["categories_scored"] = categories_dicts
 
         main_categories = [c["category"] for c in categories_dicts if c["score"] >= 0.4]
         event["main_categories"] = main_categories
+        all_main_categories.append(main_categories)
 
-        event["genres"] = detect_genres(event, main_categories)
-        enriched_events.append(event)
+    for event, genres in zip(events, detect_genres_batch(texts, all_main_categories)):
+        event["genres"] = genres
 
-    return enriched_events
+    return events
 
 
 def summarize_event(event: Dict) -> str:
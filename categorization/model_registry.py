@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import joblib
+
+from app.config import genre_model_path, genre_mlb_path, category_model_path, category_mlb_path, MODEL_MMAP_MODE
+
+
+class ModelRegistry:
+    """
+    joblib models loaded on first use instead of at import.
+
+    `preload` loads them explicitly (FastAPI lifespan, or the gunicorn master with preload_app,
+    so forked workers share the pages); load time of every model is kept in `load_times`.
+    with mmap_mode="r" numpy arrays of the models (weights, idf) are memory-mapped from the
+    uncompressed joblib files, so workers that load them independently still share physical pages.
+    """
+
+    def __init__(self, paths: Dict[str, str], mmap_mode: Optional[str] = MODEL_MMAP_MODE):
+        self._paths = {name: os.path.abspath(path) for name, path in paths.items()}
+        self.mmap_mode = mmap_mode
+        self._models = {}
+        self._lock = threading.Lock()
+        self.load_times: Dict[str, float] = {}
+
+    def get(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+        return model
+
+    def _load(self, name: str):
+        started = time.perf_counter()
+        model = joblib.load(self._paths[name], mmap_mode=self.mmap_mode)
+        self.load_times[name] = time.perf_counter() - started
+        self._models[name] = model
+        print(f"[Models] Loaded {name} in {self.load_times[name] * 1000:.0f} ms")
+        return model
+
+    def reload(self, name: str):
+        """
+        loads a replaced model file and swaps it in; write new models with `save_model` so the swap is atomic
+        """
+        with self._lock:
+            return self._load(name)
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        for name in names or self._paths:
+            self.get(name)
+        return dict(self.load_times)
+
+
+def save_model(model, path: str):
+    """
+    dumps a model uncompressed (required for mmap) next to the target and renames it over the old file
+    """
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+
+models = ModelRegistry({
+    "genre_model": genre_model_path,
+    "genre_mlb": genre_mlb_path,
+    "category_model": category_model_path,
+    "category_mlb": category_mlb_path,
+})
@@ -1,6 +1,5 @@
 import json
 import random
-import joblib
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
@@ -9,6 +8,7 @@ from sklearn.preprocessing import MultiLabelBinarizer
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.pipeline import make_pipeline
 from app.config import CATEGORY_KEYWORDS
+from categorization.model_registry import save_model
 from services.firestore_client import db
 
 
@@ -138,8 +138,8 @@ def train_model_with_pretrain_and_finetune():
 
 
     # --- збереження ---
-    joblib.dump(model, "models/category_model_multi.joblib")
-    joblib.dump(mlb, "models/category_mlb.joblib")
+    save_model(model, "models/category_model_multi.joblib")
+    save_model(mlb, "models/category_mlb.joblib")
     print("✅ Модель збережено.")
 
 
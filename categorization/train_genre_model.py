@@ -1,10 +1,10 @@
-import joblib
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.pipeline import Pipeline
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.svm import LinearSVC
 from sklearn.preprocessing import MultiLabelBinarizer
 from app.config import GENRES, IMPLICIT_GENRE_HINTS
+from categorization.model_registry import save_model
 
 # Формуємо навчальний набір
 train_texts = []
@@ -34,5 +34,5 @@ genre_model = Pipeline([
 genre_model.fit(train_texts, Y)
 
 # Збереження
-joblib.dump(genre_model, 'models/genre_model.joblib')
-joblib.dump(mlb_genres, 'models/genre_mlb.joblib')
+save_model(genre_model, 'models/genre_model.joblib')
+save_model(mlb_genres, 'models/genre_mlb.joblib')
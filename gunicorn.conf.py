@@ -0,0 +1,15 @@
+# gunicorn -c gunicorn.conf.py app.main:app
+import os
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# застосунок імпортується в master-процесі до fork, тож моделі, завантажені тут,
+# спільні для всіх воркерів (copy-on-write). Firestore клієнт лінивий і створюється вже у воркерах.
+preload_app = True
+
+
+def on_starting(server):
+    from categorization.model_registry import models
+    models.preload()
@@ -0,0 +1,119 @@
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from cachetools import TTLCache
+from google.cloud import firestore
+
+from app.config import RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL_MINUTES, RECOMMENDATION_CACHE_PERSIST
+
+# поле документа користувача з готовими рекомендаціями
+PERSISTED_FIELD = "recommendations"
+
+
+def recommendation_key(user_data: dict, favourites_count: int, index_version: str, top_n: int) -> str:
+    """
+    everything a ranking depends on: the profile revision (bumped on profile updates and likes),
+    the number of favourites (unlikes are written by the app directly and only change this),
+    the catalogue snapshot and the list size
+    """
+    return f"{user_data.get('recommendations_revision', 0)}:{favourites_count}:{index_version}:{top_n}"
+
+
+class RecommendationCache:
+    """
+    ready recommendation lists per user: an in-process LRU with TTL, backed by the
+    `recommendations` field of the user document, which the API reads anyway - so lists
+    precomputed offline (or by another worker) are served without extra reads.
+
+    an entry is only served while its key matches, so a new profile revision or a new
+    event index makes older entries stale without explicit deletes.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float, persist: bool = False):
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "persisted_hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: str, key: str, user_data: Optional[dict] = None) -> Optional[List[str]]:
+        """
+        :param user_data: the loaded user document; its persisted list is used on a local miss
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == key:
+                self._stats["hits"] += 1
+                return entry[1]
+
+        event_ids = self._persisted(user_data, key)
+        with self._lock:
+            if event_ids is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries[user_id] = (key, event_ids)
+            self._stats["persisted_hits"] += 1
+        return event_ids
+
+    def set(self, user_id: str, key: str, event_ids: List[str]):
+        """
+        stores the list locally; callers persist it with persisted_update() through their own client
+        """
+        with self._lock:
+            self._entries[user_id] = (key, event_ids)
+
+    def invalidate(self, user_id: str):
+        """
+        drops the local entry; persisted and other workers' entries expire through the profile revision
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["persisted_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["persisted_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def persisted_update(self, key: str, event_ids: List[str], ttl_seconds: Optional[float] = None) -> dict:
+        """
+        user document update that stores the list
+
+        :param ttl_seconds: how long the persisted list stays valid (defaults to the cache TTL)
+        """
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds or self.ttl_seconds)
+        return {
+            PERSISTED_FIELD: {
+                "key": key,
+                "event_ids": event_ids,
+                "computed_at": firestore.SERVER_TIMESTAMP,
+                "expires_at": expires_at,
+            },
+        }
+
+    def _persisted(self, user_data: Optional[dict], key: str) -> Optional[List[str]]:
+        data = (user_data or {}).get(PERSISTED_FIELD)
+        if not isinstance(data, dict):
+            return None
+
+        expires_at = data.get("expires_at")
+        if data.get("key") != key or not isinstance(expires_at, datetime):
+            return None
+        if datetime.now(timezone.utc) > expires_at:
+            return None
+        return data.get("event_ids")
+
+
+recommendation_cache = RecommendationCache(
+    maxsize=RECOMMENDATION_CACHE_SIZE,
+    ttl_seconds=RECOMMENDATION_CACHE_TTL_MINUTES * 60,
+    persist=RECOMMENDATION_CACHE_PERSIST,
+)
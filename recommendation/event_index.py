@@ -0,0 +1,395 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+try:
+    import fcntl
+except ImportError:  # Windows: збірки індексу не синхронізуються між процесами
+    fcntl = None
+
+from app.config import EVENT_INDEX_CHECK_SECONDS, EVENT_INDEX_DIR, SIMILAR_EVENTS_NEIGHBOURS
+from recommendation.feature_space import FeatureSpace, get_feature_space
+from recommendation.neighbours import compute_neighbours, exact_similar_rows
+from recommendation.sparse import stack_csr, vector_length
+from recommendation.vectorizer import extract_event_fields_for_vectorization
+from services.firestore_client import db, get_catalogue_version, set_catalogue_version, update_event_vectors
+
+
+class EventIndex:
+    """
+    process-local snapshot of all events with component vectors.
+
+    every field is kept as one float32 CSR matrix (rows implicitly zero-padded to the
+    longest vector of that field) plus the real length of each row, so events vectorized
+    with different vocabularies keep their original dimensionality.
+    """
+
+    def __init__(self, ids: List[str], vectors: Dict[str, csr_matrix], lengths: Dict[str, np.ndarray],
+                 norms: Dict[str, np.ndarray], latitudes: np.ndarray, longitudes: np.ndarray, start_times: list, addresses: List[str],
+                 built_at: Optional[float] = None, neighbours: Optional[np.ndarray] = None,
+                 neighbour_scores: Optional[np.ndarray] = None, content_version: Optional[str] = None):
+        self.ids = ids
+        self.positions = {event_id: i for i, event_id in enumerate(ids)}
+        self.vectors = vectors
+        self.lengths = lengths
+        self.norms = norms
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.start_times = start_times
+        self.addresses = addresses
+        self.built_at = built_at if built_at is not None else time.time()
+        self.content_version = content_version
+        # попередньо пораховані найближчі сусіди кожної події (рядки індексу), див. build_neighbours
+        self.neighbours = neighbours
+        self.neighbour_scores = neighbour_scores
+        # каталог, з якого індекс відкрито (None - індекс побудовано в пам'яті)
+        self.path: Optional[str] = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def version(self) -> str:
+        """
+        identifies the catalogue snapshot: equal for indexes built from the same events, no matter
+        when or by which process they were built
+        """
+        return self.content_version or f"{self.built_at:.6f}"
+
+    def row_components(self, row: int) -> Dict[str, np.ndarray]:
+        """
+        component vectors of one event, trimmed to their original length
+        """
+        return {
+            field: matrix[row].toarray().ravel()[:self.lengths[field][row]]
+            for field, matrix in self.vectors.items()
+            if self.lengths[field][row] > 0
+        }
+
+    def build_neighbours(self, k: int = SIMILAR_EVENTS_NEIGHBOURS):
+        started = time.perf_counter()
+        self.neighbours, self.neighbour_scores = compute_neighbours(self.vectors, self.lengths, self.norms, k)
+        print(f"[EventIndex] Computed {k} neighbours for {len(self)} events "
+              f"in {time.perf_counter() - started:.1f} s.")
+
+    def similar_rows(self, row: int, top_n: int) -> List[int]:
+        """
+        rows most similar to the given one: precomputed neighbours if there are enough of them, else an exact scan
+        """
+        if self.neighbours is not None and self.neighbours.shape[1] >= min(top_n, len(self) - 1):
+            return [int(j) for j in self.neighbours[row][:top_n] if j >= 0]
+        return exact_similar_rows(self, row, top_n)
+
+    @classmethod
+    def from_events(cls, events: List[dict], space: Optional[FeatureSpace] = None) -> "EventIndex":
+        """
+        builds the index; with a feature space, events vectorized in another version of it
+        (or not vectorized at all) are re-projected into the current one
+        """
+        if space is not None:
+            reproject_events(events, space)
+        events = [e for e in events if e.get("component_vectors")]
+        n = len(events)
+
+        field_names = sorted({field for e in events for field in e["component_vectors"]})
+        vectors = {}
+        lengths = {}
+        norms = {}
+        for field in field_names:
+            values = [e["component_vectors"].get(field) for e in events]
+            field_lengths = np.array([vector_length(v) for v in values], dtype=np.int32)
+            matrix = stack_csr(values, int(field_lengths.max(initial=0)))
+            vectors[field] = matrix
+            lengths[field] = field_lengths
+            norms[field] = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+
+        latitudes = np.full(n, np.nan)
+        longitudes = np.full(n, np.nan)
+        addresses = []
+        for i, e in enumerate(events):
+            venue = e.get("venue") or {}
+            if venue.get("latitude") is not None and venue.get("longitude") is not None:
+                latitudes[i] = venue["latitude"]
+                longitudes[i] = venue["longitude"]
+            addresses.append(venue.get("address", ""))
+
+        return cls(
+            ids=[e.get("id") for e in events],
+            content_version=content_version(events),
+            vectors=vectors,
+            lengths=lengths,
+            norms=norms,
+            latitudes=latitudes,
+            longitudes=longitudes,
+            start_times=[e.get("startTime") for e in events],
+            addresses=addresses,
+        )
+
+    def save(self, path: str):
+        """
+        writes the index as raw .npy arrays (plus a json with ids and strings) that can be memory-mapped
+        """
+        os.makedirs(path)
+        for field, matrix in self.vectors.items():
+            np.save(os.path.join(path, f"{field}.data.npy"), matrix.data)
+            np.save(os.path.join(path, f"{field}.indices.npy"), matrix.indices)
+            np.save(os.path.join(path, f"{field}.indptr.npy"), matrix.indptr)
+            np.save(os.path.join(path, f"{field}.lengths.npy"), self.lengths[field])
+            np.save(os.path.join(path, f"{field}.norms.npy"), self.norms[field])
+        np.save(os.path.join(path, "latitudes.npy"), self.latitudes)
+        np.save(os.path.join(path, "longitudes.npy"), self.longitudes)
+        np.save(os.path.join(path, "start_times.npy"), np.array(
+            [t.timestamp() if isinstance(t, datetime) else np.nan for t in self.start_times]))
+        if self.neighbours is not None:
+            np.save(os.path.join(path, "neighbours.npy"), self.neighbours)
+            np.save(os.path.join(path, "neighbour_scores.npy"), self.neighbour_scores)
+
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self.ids,
+                "addresses": self.addresses,
+                "built_at": self.built_at,
+                "content_version": self.content_version,
+                "shapes": {field: list(matrix.shape) for field, matrix in self.vectors.items()},
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "EventIndex":
+        """
+        opens a saved index; with mmap_mode="r" all worker processes share the same physical pages
+        """
+        def load_array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        vectors, lengths, norms = {}, {}, {}
+        for field, shape in meta["shapes"].items():
+            vectors[field] = csr_matrix(
+                (load_array(f"{field}.data"), load_array(f"{field}.indices"), load_array(f"{field}.indptr")),
+                shape=tuple(shape), copy=False,
+            )
+            lengths[field] = load_array(f"{field}.lengths")
+            norms[field] = load_array(f"{field}.norms")
+
+        index = cls(
+            ids=meta["ids"],
+            vectors=vectors,
+            lengths=lengths,
+            norms=norms,
+            latitudes=load_array("latitudes"),
+            longitudes=load_array("longitudes"),
+            start_times=[
+                None if np.isnan(ts) else datetime.fromtimestamp(ts, timezone.utc)
+                for ts in load_array("start_times")
+            ],
+            addresses=meta["addresses"],
+            built_at=meta["built_at"],
+            content_version=meta.get("content_version"),
+            neighbours=load_array("neighbours") if os.path.exists(os.path.join(path, "neighbours.npy")) else None,
+            neighbour_scores=load_array("neighbour_scores")
+            if os.path.exists(os.path.join(path, "neighbour_scores.npy")) else None,
+        )
+        index.path = path
+        return index
+
+
+def content_version(events: List[dict]) -> str:
+    """
+    hash of what rankings depend on: event ids, their source payload hashes and feature space versions
+    """
+    digest = hashlib.sha1()
+    for event_id, source_hash, vector_version in sorted(
+            (str(e.get("id")), str(e.get("source_hash") or ""), str(e.get("vector_version") or "")) for e in events):
+        digest.update(f"{event_id}|{source_hash}|{vector_version}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def reproject_events(events: List[dict], space: FeatureSpace) -> List[dict]:
+    """
+    re-vectorizes in place events built in another version of the space
+
+    :return: the re-projected events
+    """
+    stale = [e for e in events if e.get("vector_version") != space.version]
+    if stale:
+        raw_events = [extract_event_fields_for_vectorization(e) for e in stale]
+        for event, component_vectors in zip(stale, space.vectorize(raw_events)):
+            event["component_vectors"] = component_vectors
+            event["vector_version"] = space.version
+        print(f"[EventIndex] Re-projected {len(stale)} events into feature space {space.version}.")
+    return stale
+
+
+_index: Optional[EventIndex] = None
+# каталог опублікованої версії, з якої відкрито _index (None - власна копія в пам'яті)
+_index_directory: Optional[str] = None
+_checked_at = float("-inf")
+_lock = threading.Lock()
+
+CURRENT_POINTER = "CURRENT"
+KEEP_VERSIONS = 2
+BUILD_LOCK = ".build.lock"
+
+
+def load_event_index() -> EventIndex:
+    events = [doc.to_dict() for doc in db.collection("events").stream()]
+    space = get_feature_space()
+    if space is not None:
+        # перепроєктовані вектори зберігаються, щоб наступні збірки їх не рахували знову
+        reprojected = reproject_events(events, space)
+        if reprojected:
+            try:
+                update_event_vectors(reprojected)
+            except Exception as e:
+                print(f"[EventIndex] ⚠️ Could not store re-projected vectors: {e}")
+    return EventIndex.from_events(events, space)
+
+
+def publish_event_index(index: EventIndex, directory: str = EVENT_INDEX_DIR) -> str:
+    """
+    saves the index into a new version directory and atomically repoints CURRENT to it;
+    readers keep using their mapped files until they switch, old versions beyond KEEP_VERSIONS are removed
+    """
+    version = f"{time.time_ns()}-{os.getpid()}"
+    os.makedirs(directory, exist_ok=True)
+    index.save(os.path.join(directory, version))
+
+    pointer_tmp = os.path.join(directory, f"{CURRENT_POINTER}.{version}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_POINTER))
+
+    versions = sorted(
+        (name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))),
+        key=lambda name: int(name.split("-")[0]),
+    )
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version
+
+
+def current_index_version(directory: str = EVENT_INDEX_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+@contextmanager
+def build_lock(directory: str = EVENT_INDEX_DIR):
+    """
+    serializes index builds between the worker processes of one host
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, BUILD_LOCK), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def map_published_index(expected_version: Optional[str] = None) -> Optional[EventIndex]:
+    """
+    switches to the index published on this host (if it has the expected content version); call under _lock
+    """
+    global _index, _index_directory
+    directory = current_index_version()
+    if directory is None:
+        return None
+    if directory != _index_directory:
+        try:
+            index = EventIndex.load(os.path.join(EVENT_INDEX_DIR, directory))
+        except (OSError, ValueError) as e:
+            print(f"[EventIndex] ⚠️ Could not map index {directory}: {e}")
+            return None
+        if expected_version is not None and index.version != expected_version:
+            return None
+        _index, _index_directory = index, directory
+        print(f"[EventIndex] 📂 Mapped index {directory} ({len(index)} events).")
+    if expected_version is not None and _index.version != expected_version:
+        return None
+    return _index
+
+
+def build_event_index() -> EventIndex:
+    """
+    builds the index from Firestore, publishes it for the other workers, records its version as the
+    catalogue version for other instances and switches to the mapped copy; call under _lock
+    """
+    global _index, _index_directory
+    index = load_event_index()
+    index.build_neighbours()
+    _index, _index_directory = index, None
+    try:
+        directory = publish_event_index(index)
+        # опублікована копія спільна з іншими воркерами, власна копія в пам'яті звільняється
+        _index, _index_directory = EventIndex.load(os.path.join(EVENT_INDEX_DIR, directory)), directory
+    except (OSError, ValueError) as e:
+        print(f"[EventIndex] ⚠️ Could not publish index: {e}")
+    try:
+        set_catalogue_version(index.version)
+    except Exception as e:
+        print(f"[EventIndex] ⚠️ Could not store catalogue version: {e}")
+    print(f"[EventIndex] 🔁 Loaded {len(index)} events (version {index.version}).")
+    return _index
+
+
+def refresh_event_index() -> EventIndex:
+    """
+    rebuilds the index after the catalogue changed (sync, cleanup)
+    """
+    global _checked_at
+    with _lock, build_lock():
+        _checked_at = time.monotonic()
+        return build_event_index()
+
+
+def get_event_index() -> EventIndex:
+    """
+    returns the current index. at most once per EVENT_INDEX_CHECK_SECONDS it is compared with the catalogue
+    version in Firestore; a stale index is replaced by the one published on this host, and rebuilt from
+    Firestore only if no worker here has built that version yet
+    """
+    global _checked_at
+    index = _index
+    if index is not None and time.monotonic() - _checked_at < EVENT_INDEX_CHECK_SECONDS:
+        return index
+
+    with _lock:
+        if _index is not None and time.monotonic() - _checked_at < EVENT_INDEX_CHECK_SECONDS:
+            return _index
+        try:
+            expected_version = get_catalogue_version()
+        except Exception as e:
+            print(f"[EventIndex] ⚠️ Could not read catalogue version: {e}")
+            expected_version = None
+        _checked_at = time.monotonic()
+
+        if _index is not None and expected_version in (None, _index.version):
+            return _index
+        index = map_published_index(expected_version)
+        if index is not None:
+            return index
+
+        with build_lock():
+            # поки чекали, індекс міг побудувати інший воркер
+            index = map_published_index(expected_version)
+            if index is not None:
+                return index
+            return build_event_index()
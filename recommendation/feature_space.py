@@ -0,0 +1,227 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.config import ALL_CATEGORIES, ALL_GENRES, FEATURE_SPACE_CACHE_DIR, FEATURE_SPACE_CHECK_SECONDS
+from recommendation.sparse import encode_sparse_rows
+from services.firestore_client import get_feature_space_meta, load_feature_space_blob, save_feature_space_blob
+
+CATEGORICAL_FIELDS = ["main_categories", "genres"]
+TEXT_FIELDS = ["name", "isVirtual", "venue_subtypes"]
+
+
+class FeatureSpace:
+    """
+    frozen feature space for component vectors: fixed category/genre order and
+    one fitted TfidfVectorizer per text field.
+
+    `version` is a hash of the whole space, `field_versions` - of every field separately,
+    so vectors built in different processes or syncs can be checked for compatibility.
+    `fitted_on` and `fitted_at` (number of events and time of the fit) decide when it is refitted.
+    """
+
+    def __init__(self, categories: List[str], genres: List[str], vectorizers: Dict[str, Optional[TfidfVectorizer]],
+                 fitted_on: int = 0, fitted_at: Optional[float] = None):
+        self.categories = list(categories)
+        self.genres = list(genres)
+        self.vectorizers = vectorizers
+        self.fitted_on = fitted_on
+        self.fitted_at = fitted_at if fitted_at is not None else time.time()
+
+        self.field_versions = {
+            "main_categories": _hash(self.categories),
+            "genres": _hash(self.genres),
+        }
+        for field, vectorizer in vectorizers.items():
+            if vectorizer is None:
+                self.field_versions[field] = _hash([])
+            else:
+                self.field_versions[field] = _hash([
+                    sorted(vectorizer.vocabulary_.items()),
+                    [round(float(x), 8) for x in vectorizer.idf_],
+                ])
+        self.version = _hash(sorted(self.field_versions.items()))
+
+    def to_dict(self) -> dict:
+        """
+        plain data of the space (vocabularies and idf weights), safe to store and load without pickle
+        """
+        return {
+            "categories": self.categories,
+            "genres": self.genres,
+            "fitted_on": self.fitted_on,
+            "fitted_at": self.fitted_at,
+            "vectorizers": {
+                field: None if vectorizer is None else {
+                    "vocabulary": {term: int(i) for term, i in vectorizer.vocabulary_.items()},
+                    "idf": [float(x) for x in vectorizer.idf_],
+                    "stop_words": vectorizer.stop_words,
+                }
+                for field, vectorizer in self.vectorizers.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FeatureSpace":
+        """
+        rebuilds the fitted vectorizers from to_dict() output
+        """
+        vectorizers = {}
+        for field, params in data["vectorizers"].items():
+            if params is None:
+                vectorizers[field] = None
+                continue
+            vectorizer = TfidfVectorizer(stop_words=params["stop_words"], vocabulary=params["vocabulary"])
+            vectorizer.idf_ = np.asarray(params["idf"], dtype=np.float64)
+            vectorizers[field] = vectorizer
+        return cls(data["categories"], data["genres"], vectorizers,
+                   fitted_on=data.get("fitted_on", 0), fitted_at=data.get("fitted_at"))
+
+    @property
+    def field_names(self) -> List[str]:
+        return CATEGORICAL_FIELDS + list(self.vectorizers.keys())
+
+    def category_vector(self, selected_categories) -> List[int]:
+        return [1 if category in selected_categories else 0 for category in self.categories]
+
+    def genre_vector(self, selected_genres) -> List[int]:
+        return [1 if genre in selected_genres else 0 for genre in self.genres]
+
+    def transform_field(self, field: str, texts: List[str]) -> csr_matrix:
+        """
+        vectorizes texts of one field in the frozen vocabulary
+        """
+        vectorizer = self.vectorizers.get(field)
+        if vectorizer is None:
+            return csr_matrix((len(texts), 0))
+        return vectorizer.transform([t.lower() for t in texts])
+
+    def vectorize(self, raw_events: List[dict]) -> List[Dict[str, dict]]:
+        """
+        sparse-encoded component vectors for events already passed through extract_event_fields_for_vectorization
+        """
+        if not raw_events:
+            return []
+
+        field_vectors = {
+            "main_categories": encode_sparse_rows([self.category_vector(e["main_categories"]) for e in raw_events]),
+            "genres": encode_sparse_rows([self.genre_vector(e["genres"]) for e in raw_events]),
+        }
+        for field in self.vectorizers:
+            field_vectors[field] = encode_sparse_rows(self.transform_field(field, [e[field] for e in raw_events]))
+
+        return [
+            {field: vectors[i] for field, vectors in field_vectors.items()}
+            for i in range(len(raw_events))
+        ]
+
+
+def _hash(value) -> str:
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def fit_feature_space(raw_events: List[dict], stop_words="english") -> FeatureSpace:
+    """
+    fits TF-IDF vocabularies for text fields on the given events
+    """
+    vectorizers = {}
+    for field in TEXT_FIELDS:
+        vectorizer = TfidfVectorizer(stop_words=stop_words)
+        try:
+            vectorizer.fit([e.get(field, "").lower() for e in raw_events])
+        except ValueError:
+            # порожній словник (напр. у жодної події немає subtypes)
+            vectorizer = None
+        vectorizers[field] = vectorizer
+    return FeatureSpace(ALL_CATEGORIES, ALL_GENRES, vectorizers, fitted_on=len(raw_events))
+
+
+_space: Optional[FeatureSpace] = None
+_checked_at = float("-inf")
+_lock = threading.Lock()
+
+
+def cached_space_path(version: str, directory: str = FEATURE_SPACE_CACHE_DIR) -> str:
+    return os.path.join(directory, f"{version}.json.gz")
+
+
+def dump_feature_space(space: FeatureSpace) -> bytes:
+    return gzip.compress(json.dumps(space.to_dict(), ensure_ascii=False).encode("utf-8"))
+
+
+def parse_feature_space(data: bytes, version: str) -> FeatureSpace:
+    """
+    rebuilds a stored space; its content must hash to the version it was stored under
+    """
+    space = FeatureSpace.from_dict(json.loads(gzip.decompress(data).decode("utf-8")))
+    if space.version != version:
+        raise ValueError(f"feature space content does not match version {version}")
+    return space
+
+
+def save_feature_space(space: FeatureSpace):
+    """
+    publishes the feature space in Firestore for all instances and keeps a local copy of it
+    """
+    global _space, _checked_at
+    data = dump_feature_space(space)
+    save_feature_space_blob(space.version, data)
+    _write_cached(space.version, data)
+    with _lock:
+        _space = space
+        _checked_at = time.monotonic()
+    print(f"[FeatureSpace] 💾 Saved feature space {space.version}.")
+
+
+def get_feature_space() -> Optional[FeatureSpace]:
+    """
+    returns the shared feature space or None if it was never fitted; at most once per
+    FEATURE_SPACE_CHECK_SECONDS its version is compared with Firestore and a new one is loaded
+    (from the local copy of that version if there is one)
+    """
+    global _space, _checked_at
+    if time.monotonic() - _checked_at < FEATURE_SPACE_CHECK_SECONDS:
+        return _space
+
+    with _lock:
+        if time.monotonic() - _checked_at < FEATURE_SPACE_CHECK_SECONDS:
+            return _space
+        try:
+            meta = get_feature_space_meta()
+            if meta and (_space is None or _space.version != meta["version"]):
+                _space = _load_version(meta["version"], meta["chunks"])
+                print(f"[FeatureSpace] 📂 Loaded feature space {_space.version}.")
+        except Exception as e:
+            # без зв'язку з Firestore лишається поточний простір, перевірка повториться пізніше
+            print(f"[FeatureSpace] ⚠️ Could not check feature space: {e}")
+        _checked_at = time.monotonic()
+    return _space
+
+
+def _load_version(version: str, chunks: int) -> FeatureSpace:
+    path = cached_space_path(version)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return parse_feature_space(f.read(), version)
+    data = load_feature_space_blob(version, chunks)
+    space = parse_feature_space(data, version)
+    _write_cached(version, data)
+    return space
+
+
+def _write_cached(version: str, data: bytes):
+    path = cached_space_path(version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,81 @@
+from typing import Optional, Tuple
+
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.0
+# гаверсинус відхиляється від геодезичної відстані не більше ніж на ~0.5%
+HAVERSINE_TOLERANCE = 0.005
+# далі ніж max_distance_km + FAR_DISTANCE_KM множник відстані вже мінімальний (0.1)
+FAR_DISTANCE_KM = 90
+MIN_DISTANCE_MULTIPLIER = 0.1
+
+
+def valid_coordinates(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    return np.isfinite(latitudes) & np.isfinite(longitudes) & (np.abs(latitudes) <= 90)
+
+
+def haversine_km(lat: float, lon: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    great-circle distances from one point to arrays of points
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distance_multiplier(dist_km: np.ndarray, max_km: float) -> np.ndarray:
+    """
+    1.0 within max_km, then linearly down to MIN_DISTANCE_MULTIPLIER over FAR_DISTANCE_KM
+    """
+    return np.where(dist_km <= max_km, 1.0, np.maximum(MIN_DISTANCE_MULTIPLIER, 1.0 - (dist_km - max_km) / 100))
+
+
+def distance_multipliers(user_coords: Optional[Tuple[float, float]], latitudes: np.ndarray, longitudes: np.ndarray,
+                         max_km: float) -> np.ndarray:
+    """
+    distance multipliers for all events at once; NaN where the distance is unknown.
+
+    a latitude/longitude box drops events that are surely beyond the far band, haversine is computed
+    for the rest, and the exact geodesic only for events whose haversine distance is within the tolerance
+    of the band where the multiplier changes - so results match a geodesic call per event.
+    """
+    n = len(latitudes)
+    multipliers = np.full(n, np.nan)
+    if not user_coords or None in user_coords:
+        return multipliers
+    try:
+        user_lat, user_lon = float(user_coords[0]), float(user_coords[1])
+    except (TypeError, ValueError):
+        return multipliers
+    if not np.isfinite(user_lat) or not np.isfinite(user_lon) or abs(user_lat) > 90:
+        return multipliers
+
+    valid = valid_coordinates(latitudes, longitudes)
+    multipliers[valid] = MIN_DISTANCE_MULTIPLIER
+
+    # грубий фільтр прямокутником: на 1° широти ~111 км, довготи - менше з віддаленням від екватора
+    far_km = (max_km + FAR_DISTANCE_KM) * (1 + HAVERSINE_TOLERANCE)
+    lat_span = far_km / KM_PER_DEGREE_LAT
+    cos_lat = np.cos(np.radians(min(89.0, abs(user_lat) + lat_span)))
+    lon_span = far_km / (KM_PER_DEGREE_LAT * cos_lat)
+    lon_diff = np.abs((longitudes - user_lon + 180) % 360 - 180)
+    candidates = np.flatnonzero(valid & (np.abs(latitudes - user_lat) <= lat_span)
+                                & ((lon_diff <= lon_span) | (lat_span + abs(user_lat) >= 89.0)))
+    if not len(candidates):
+        return multipliers
+
+    distances = haversine_km(user_lat, user_lon, latitudes[candidates], longitudes[candidates])
+
+    near_band = (distances >= max_km * (1 - HAVERSINE_TOLERANCE)) & (distances <= far_km)
+    for i in np.flatnonzero(near_band):
+        row = candidates[i]
+        try:
+            distances[i] = geodesic((user_lat, user_lon), (latitudes[row], longitudes[row])).km
+        except ValueError:
+            pass
+
+    multipliers[candidates] = distance_multiplier(distances, max_km)
+    return multipliers
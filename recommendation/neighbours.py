@@ -0,0 +1,103 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from recommendation.ranking import top_n_indices
+from recommendation.scoring import score_events_by_components
+
+# максимальний розмір щільного блоку схожостей (рядки x події), ~16 МБ float32
+NEIGHBOURS_CHUNK_ELEMENTS = 4_000_000
+
+
+def compute_neighbours(vectors: Dict[str, csr_matrix], lengths: Dict[str, np.ndarray], norms: Dict[str, np.ndarray],
+                       k: int, chunk_elements: int = NEIGHBOURS_CHUNK_ELEMENTS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    exact top-k item-item neighbours for every indexed event, in the same metric as
+    score_events_by_components (mean cosine over fields of equal length).
+
+    rows are scanned in chunks, so memory stays bounded by chunk_elements.
+
+    :return: (rows of neighbours, their scores), both (n_events, k); missing neighbours are -1
+    """
+    n = len(next(iter(lengths.values()))) if lengths else 0
+    k = max(0, min(k, n - 1))
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+
+    normalized = {}
+    for field, matrix in vectors.items():
+        inverse = np.divide(1.0, norms[field], out=np.zeros(n), where=norms[field] > 0)
+        normalized[field] = csr_matrix(matrix.multiply(inverse[:, None]), dtype=np.float32)
+
+    chunk = max(1, chunk_elements // n)
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        totals = np.zeros((stop - start, n), dtype=np.float32)
+        counts = np.zeros((stop - start, n), dtype=np.float32)
+        for field, matrix in normalized.items():
+            field_lengths = lengths[field]
+            matched = (field_lengths[start:stop, None] == field_lengths[None, :]) & (field_lengths[start:stop, None] > 0)
+            totals += (matrix[start:stop] @ matrix.T).toarray() * matched
+            counts += matched
+
+        similarity = np.divide(totals, counts, out=np.zeros_like(totals), where=counts > 0)
+
+        for offset, row_similarity in enumerate(similarity):
+            top = top_n_indices(row_similarity, k, exclude=[start + offset])
+            neighbours[start + offset, :len(top)] = top
+            scores[start + offset, :len(top)] = row_similarity[top]
+
+    return neighbours, scores
+
+
+def exact_similar_rows(index, row: int, top_n: int) -> List[int]:
+    """
+    brute-force scan over the whole index, used when neighbours were not precomputed
+    """
+    base_components = index.row_components(row)
+    scores = score_events_by_components(base_components, index.vectors, index.lengths, index.norms,
+                                        base_components.keys())
+    return top_n_indices(scores, top_n, exclude=[row])
+
+
+def compare_neighbours(index, top_n: int = 10, sample_size: int = 200, seed: Optional[int] = 0) -> Dict[str, float]:
+    """
+    recall@top_n and per-query latency of precomputed neighbours against the exact scan, on a random sample of events
+    """
+    if index.neighbours is None or len(index) < 2:
+        return {"sample_size": 0}
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=min(sample_size, len(index)), replace=False)
+
+    started = time.perf_counter()
+    exact = [exact_similar_rows(index, int(row), top_n) for row in rows]
+    exact_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    precomputed = [[int(j) for j in index.neighbours[row][:top_n] if j >= 0] for row in rows]
+    precomputed_seconds = time.perf_counter() - started
+
+    # рівні за схожістю події можуть стояти в іншому порядку, тому порівнюються і за рахунком
+    hits = 0
+    total = 0
+    for row, exact_rows, found_rows in zip(rows, exact, precomputed):
+        if not exact_rows:
+            continue
+        base_components = index.row_components(int(row))
+        scores = score_events_by_components(base_components, index.vectors, index.lengths, index.norms,
+                                            base_components.keys())
+        threshold = scores[exact_rows[-1]] - 1e-5
+        hits += sum(1 for j in found_rows if scores[j] >= threshold)
+        total += len(exact_rows)
+
+    return {
+        "sample_size": len(rows),
+        "recall": round(hits / total, 4) if total else 1.0,
+        "exact_ms_per_query": round(exact_seconds * 1000 / len(rows), 3),
+        "precomputed_ms_per_query": round(precomputed_seconds * 1000 / len(rows), 3),
+    }
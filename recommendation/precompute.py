@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from app.config import PRECOMPUTE_ACTIVE_DAYS, PRECOMPUTE_WORKERS, PRECOMPUTE_TOP_N, SCHEDULE_INTERVAL_HOURS
+from recommendation.cache import recommendation_cache, recommendation_key
+from recommendation.event_index import EventIndex, get_event_index
+from recommendation.recommendation_engine import load_recommendation_context, rank_events
+from services.firestore_client import db
+
+# індекс, відкритий у процесі-воркері пулу: (каталог, EventIndex)
+_worker_index = None
+
+
+def _rank_in_worker(index_path: str, context: dict, top_n: int):
+    """
+    runs in a pool process: maps the published index once per directory and ranks one user
+    """
+    global _worker_index
+    if _worker_index is None or _worker_index[0] != index_path:
+        _worker_index = (index_path, EventIndex.load(index_path))
+    return rank_events(context, _worker_index[1], top_n)
+
+
+def _result_or_none(user_id: str, compute):
+    try:
+        return compute()
+    except Exception as e:
+        print(f"[Precompute] ❌ Failed to rank events for {user_id}: {e}")
+        return None
+
+
+def _persist(user_id: str, key: str, event_ids) -> bool:
+    try:
+        db.collection("users").document(user_id).update(
+            recommendation_cache.persisted_update(key, event_ids, SCHEDULE_INTERVAL_HOURS * 3600 * 2))
+        return True
+    except Exception as e:
+        print(f"[Precompute] ⚠️ Could not store recommendations for {user_id}: {e}")
+        return False
+
+
+def get_recently_active_users(days: int = PRECOMPUTE_ACTIVE_DAYS) -> list:
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    query = db.collection("users").where(filter=FieldFilter("last_active", ">=", since))
+    return list(query.stream())
+
+
+def precompute_recommendations(progress: Optional[dict] = None, top_n: int = PRECOMPUTE_TOP_N,
+                               workers: int = PRECOMPUTE_WORKERS) -> Dict[str, int]:
+    """
+    recomputes recommendations of recently active users after a sync and stores them in their
+    user documents, so the API serves them from the read it already does.
+
+    Firestore reads run in threads, the CPU-bound ranking in a process pool that maps the same
+    published index directory as this process; an index built only in memory is ranked here.
+
+    :param progress: job progress, gets the stage and the number of active users
+    """
+    if progress is None:
+        progress = {}
+    started = time.perf_counter()
+    index = get_event_index()
+
+    progress["stage"] = "loading"
+    user_docs = get_recently_active_users()
+    progress["active_users"] = len(user_docs)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers) * 4) as executor:
+        contexts = list(executor.map(
+            lambda doc: load_recommendation_context(doc.id, index, user_doc=doc), user_docs))
+    pending = [(doc, context) for doc, context in zip(user_docs, contexts) if context is not None]
+
+    progress["stage"] = "ranking"
+    if index.path is not None and workers > 1 and len(pending) > 1:
+        # spawn: gRPC-клієнт Firestore не переживає fork
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_rank_in_worker, index.path, context, top_n) for _, context in pending]
+            rankings = [_result_or_none(doc.id, future.result) for (doc, _), future in zip(pending, futures)]
+    else:
+        rankings = [_result_or_none(doc.id, lambda: rank_events(context, index, top_n)) for doc, context in pending]
+
+    progress["stage"] = "storing"
+    stored = 0
+    for (doc, context), event_ids in zip(pending, rankings):
+        if not event_ids:
+            continue
+        key = recommendation_key(doc.to_dict(), context["favourites_count"], index.version, top_n)
+        recommendation_cache.set(doc.id, key, event_ids)
+        stored += _persist(doc.id, key, event_ids)
+
+    report = {"active_users": len(user_docs), "precomputed": stored}
+    print(f"[Precompute] ✅ Stored recommendations for {stored}/{len(user_docs)} active users "
+          f"in {time.perf_counter() - started:.1f} s.")
+    return report
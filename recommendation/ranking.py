@@ -0,0 +1,44 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def top_n_indices(scores: np.ndarray, top_n: int, tie_break: Optional[Sequence] = None,
+                  exclude: Optional[Sequence[int]] = None) -> List[int]:
+    """
+    positions of the top_n highest scores, best first, without sorting the whole array.
+
+    candidates are picked with argpartition and only they are sorted; equal scores are ordered
+    by `tie_break` (e.g. event ids), or by position if it is not given, so results are deterministic.
+
+    :param exclude: positions that must not be returned (e.g. the query event itself)
+    """
+    scores = np.asarray(scores, dtype=float)
+    if exclude is not None and len(exclude):
+        scores = scores.copy()
+        scores[np.asarray(exclude)] = -np.inf
+        available = len(scores) - len(set(exclude))
+    else:
+        available = len(scores)
+
+    top_n = min(top_n, available)
+    if top_n <= 0:
+        return []
+
+    if top_n < len(scores):
+        # усі рівні граничному значенню теж потрапляють у кандидати, щоб tie-break не залежав від argpartition
+        threshold = np.partition(scores, len(scores) - top_n)[len(scores) - top_n]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+
+    secondary = candidates if tie_break is None else np.asarray(tie_break)[candidates]
+    order = np.lexsort((secondary, -scores[candidates]))
+    return [int(i) for i in candidates[order[:top_n]]]
+
+
+def top_n_ids(scores: np.ndarray, ids: Sequence[str], top_n: int, exclude: Optional[Sequence[int]] = None) -> List[str]:
+    """
+    ids of the top_n highest scores; ties are broken by id
+    """
+    return [ids[i] for i in top_n_indices(scores, top_n, tie_break=ids, exclude=exclude)]
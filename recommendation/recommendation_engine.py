@@ -1,15 +1,20 @@
+import asyncio
 import json
 import re
 from datetime import datetime, timezone
 
 import numpy as np
-from geopy.distance import geodesic
 
-from recommendation.user_profile import build_profile_vector, geocode_address, get_city_from_address
-from recommendation.scoring import score_event_by_components
-from recommendation.vectorizer import extract_event_fields_for_vectorization, category_vector, genre_vector, \
-    vectorize_field
-from services.firestore_client import db
+from recommendation.cache import recommendation_cache, recommendation_key
+from recommendation.user_profile import geocode_address, get_city_from_address, compatible_profile_components, \
+    profile_from_onboarding, touch_last_active_async, save_profile_async, liked_event_ids_async
+from recommendation.event_index import get_event_index, reproject_events
+from recommendation.feature_space import get_feature_space
+from recommendation.geo import distance_multipliers
+from recommendation.ranking import top_n_ids
+from recommendation.scoring import score_events_by_components
+from recommendation.sparse import decode_dense
+from services.firestore_client import db, async_db
 
 TIME_BUCKETS = {
     "morning": (6, 12),
@@ -50,39 +55,86 @@ def is_event_time_suitable(event, preferences):
     return False
 
 
-def is_within_distance(user_loc, event_loc, max_km):
-    if not user_loc or not event_loc or None in user_loc or None in event_loc:
-        return False, None
-    try:
-        dist = geodesic(user_loc, event_loc).km
-        return dist <= max_km, dist
-    except Exception:
-        return False, None
+def get_liked_event_components(index, event_ids):
+    """
+    component vectors of liked events: taken from the index, events missing there are
+    loaded from Firestore and projected into the current feature space
+    """
+    components = []
+    missing = []
+    for event_id in event_ids:
+        row = index.positions.get(event_id)
+        if row is not None:
+            components.append(index.row_components(row))
+        elif event_id:
+            missing.append(event_id)
+
+    space = get_feature_space()
+    for event_id in missing:
+        event_doc = db.collection("events").document(event_id).get()
+        if not event_doc.exists:
+            continue
+        event = event_doc.to_dict()
+        if space is not None:
+            reproject_events([event], space)
+        if event.get("component_vectors"):
+            components.append({k: decode_dense(v) for k, v in event["component_vectors"].items()})
 
+    return components
 
 
-def recommend_events_for_user(user_id, top_n=20):
+def load_recommendation_context(user_id, index, user_doc):
     """
-    create recommendations for user
+    reads everything the ranking needs for one user from Firestore (blocking client, for offline precomputation)
 
     :param user_id
-    :param top_n: count of recommendations
-    :return: list of recommended events
+    :param index: event index used for liked events' vectors
+    :param user_doc: loaded user document
+    :return: picklable dict for rank_events or None if the user can't get recommendations
     """
 
     # ---------------- user info
-    user_doc = db.collection("users").document(user_id).get()
     if not user_doc.exists:
-        return []
+        return None
 
     onboarding_doc = db.collection("onboardingResponses").document(user_id).get()
     if not onboarding_doc.exists:
-        return []
+        return None
+
+    # ----------------- fav events info
+    liked_events_docs = db.collection("users").document(user_id).collection("favourite_events").stream()
+    liked_event_refs = [doc.to_dict().get("id") for doc in liked_events_docs]
 
-    responses = onboarding_doc.to_dict()
+    return build_recommendation_context(index, user_doc.to_dict(), onboarding_doc.to_dict(), liked_event_refs)
+
+
+async def load_recommendation_context_async(user_id, index, user_data, liked_event_refs):
+    """
+    load_recommendation_context for request handlers: onboarding is read through the async client,
+    a profile rebuilt from it is saved the same way
+    """
+    onboarding_doc = await async_db.collection("onboardingResponses").document(user_id).get()
+    if not onboarding_doc.exists:
+        return None
+
+    # простір ознак і лайкнуті події поза індексом можуть читатись синхронно - поза event loop
+    context = await asyncio.to_thread(build_recommendation_context, index, user_data, onboarding_doc.to_dict(),
+                                      liked_event_refs)
+    if context is not None and context["rebuilt_profile"] is not None:
+        await save_profile_async(user_id, context["rebuilt_profile"])
+    return context
+
+
+def build_recommendation_context(index, user_data, responses, liked_event_refs):
+    """
+    ranking context from already loaded user data, onboarding responses and liked event ids;
+    a profile missing in the current feature space is rebuilt from the responses and returned
+    as `rebuilt_profile` for the caller to save
+    """
     answers = responses.get("answers", {})
 
     # --- координати
+    location_data = None
     try:
         location_data = answers.get("3")[0]
         user_location_coords = (location_data["lat"], location_data["lon"])
@@ -100,47 +152,27 @@ def recommend_events_for_user(user_id, top_n=20):
     preferred_times = answers.get("5", [])
 
 
-    profile_components = user_doc.to_dict().get("component_profile_vectors")
+    rebuilt_profile = None
+    profile_components = compatible_profile_components(user_data)
     if not profile_components:
-        profile_components = build_profile_vector(user_id)
-        if not profile_components:
-            return []
+        profile_components = rebuilt_profile = profile_from_onboarding(responses)
 
-    # ----------------- fav events info
-    liked_events_docs = db.collection("users").document(user_id).collection("favourite_events").stream()
-    liked_event_refs = [doc.to_dict().get("id") for doc in liked_events_docs]
-    liked_events = []
-    for event_id in liked_event_refs:
-        event_doc = db.collection("events").document(event_id).get()
-        if event_doc.exists:
-            liked_events.append(event_doc.to_dict())
+    liked_components = get_liked_event_components(index, liked_event_refs)
 
     aggregated_profile = {}
     weight_liked = 0.7
     weight_profile = 0.3
 
-    if liked_events:
-        liked_fields = [extract_event_fields_for_vectorization(event) for event in liked_events]
-        field_names = liked_fields[0].keys()
-
-        liked_field_vectors = {}
+    if liked_components:
+        field_names = liked_components[0].keys()
 
         for field in field_names:
-            if field == "main_categories":
-                liked_field_vectors[field] = [category_vector(e[field]) for e in liked_fields]
-            elif field == "genres":
-                liked_field_vectors[field] = [genre_vector(e[field]) for e in liked_fields]
-            else:
-                texts = [e[field].lower() for e in liked_fields]
-                vectors, _ = vectorize_field(texts)
-                liked_field_vectors[field] = vectors
-
-        for field in field_names:
-            liked_vecs = np.array(liked_field_vectors[field])
-            liked_mean = np.mean(liked_vecs, axis=0)
+            liked_vecs = [c[field] for c in liked_components if len(c.get(field, [])) == len(liked_components[0][field])]
+            liked_mean = np.mean(np.array(liked_vecs, dtype=float), axis=0)
 
             #     combined = (liked_mean + profile_vec) / 2
-            if profile_components and field in profile_components:
+            if profile_components and field in profile_components \
+                    and len(profile_components[field]) == len(liked_mean):
                 profile_vec = np.array(profile_components[field])
                 combined = liked_mean * weight_liked + profile_vec * weight_profile
                 aggregated_profile[field] = combined
@@ -151,62 +183,93 @@ def recommend_events_for_user(user_id, top_n=20):
         aggregated_profile = {k: np.array(v) for k, v in profile_components.items()}
         field_names = aggregated_profile.keys()
 
+    return {
+        "aggregated_profile": aggregated_profile,
+        "field_names": list(field_names),
+        "user_location_coords": user_location_coords,
+        "location_data": location_data,
+        "max_distance_km": max_distance_km,
+        "preferred_times": preferred_times,
+        "favourites_count": len(liked_event_refs),
+        "rebuilt_profile": rebuilt_profile,
+    }
+
+
+def rank_events(context, index, top_n=20):
+    """
+    ranks all indexed events for a loaded context; pure function of its arguments, so it can run in a worker process
+
+    :return: list of recommended events
+    """
+    user_location_coords = context["user_location_coords"]
+    location_data = context["location_data"]
+    max_distance_km = context["max_distance_km"]
+    preferred_times = context["preferred_times"]
+
     # --- events info
-    events_docs = db.collection("events").stream()
+    scores = score_events_by_components(context["aggregated_profile"], index.vectors, index.lengths, index.norms,
+                                        context["field_names"])
 
-    events = []
-    for doc in events_docs:
-        event = doc.to_dict()
-        if "component_vectors" not in event:
-            continue
-        # if not isinstance(event.get("endTime"), datetime) or event["endTime"] < datetime.now(timezone.utc):
-        #     continue
-        events.append(event)
-
-    scored = []
-    for event in events:
-        event_components = event.get("component_vectors", {})
-        avg_score = score_event_by_components(aggregated_profile, event_components, field_names)
-
-        # --- вплив відстані
-        venue = event.get("venue", {})
-        lat = venue.get("latitude")
-        lon = venue.get("longitude")
-
-        if lat is not None and lon is not None:
-            event_coords = (lat, lon)
-        else:
-            event_coords = None
+    final_scores = np.array(scores, dtype=float)
 
-        within_dist, dist = is_within_distance(user_location_coords, event_coords, max_distance_km)
+    # --- вплив відстані (для всіх подій одразу)
+    multipliers = distance_multipliers(user_location_coords, index.latitudes, index.longitudes, max_distance_km)
+    known = ~np.isnan(multipliers)
+    final_scores[known] *= multipliers[known]
 
-        if dist is not None:
-            if within_dist:
-                distance_score_multiplier = 1.0
-            else:
-                distance_score_multiplier = max(0.1, 1.0 - (dist - max_distance_km) / 100)
-            avg_score *= distance_score_multiplier
-        elif location_data:
-            event_city = get_city_from_address(venue.get("address", ""))
-            try:
-                user_city = get_city_from_address(location_data.get("title", ""))
-            except Exception:
-                user_city = location_data
-            if user_city and event_city and user_city.lower() != event_city.lower():
-                avg_score *= 0.5
+    # --- відстань невідома: порівняння міст
+    if location_data:
+        try:
+            user_city = get_city_from_address(location_data.get("title", ""))
+        except Exception:
+            user_city = location_data
+        if user_city:
+            for row in np.flatnonzero(~known):
+                event_city = get_city_from_address(index.addresses[row])
+                if event_city and user_city.lower() != event_city.lower():
+                    final_scores[row] *= 0.5
+
+    # --- вплив часу
+    for row, start_time in enumerate(index.start_times):
+        if not is_event_time_suitable({"startTime": start_time}, {"time": preferred_times}):
+            final_scores[row] *= 0.7
+
+    return top_n_ids(final_scores, index.ids, top_n)
 
-        # --- вплив часу
-        if not is_event_time_suitable(event, {"time": preferred_times}):
-            avg_score *= 0.7
 
-        scored.append((avg_score, event))
+async def get_recommendations_async(user_id, top_n=20):
+    """
+    cached or precomputed recommendations; recomputed only when the profile revision, the favourites
+    or the event index changed. Firestore is read through the async client, index loading and
+    ranking run in a thread so the event loop keeps serving other requests
+    """
+    user_doc, liked_event_refs = await asyncio.gather(
+        async_db.collection("users").document(user_id).get(),
+        liked_event_ids_async(user_id),
+    )
+    if not user_doc.exists:
+        return []
+
+    user_data = user_doc.to_dict()
+    index, _ = await asyncio.gather(asyncio.to_thread(get_event_index), touch_last_active_async(user_id, user_data))
 
-    scored.sort(reverse=True, key=lambda x: x[0])
-    return [e.get("id") for _, e in scored[:top_n]]
+    key = recommendation_key(user_data, len(liked_event_refs), index.version, top_n)
+    cached = recommendation_cache.get(user_id, key, user_data)
+    if cached is not None:
+        return cached
 
-def get_recommendations(user_id, top_n=20):
-    return recommend_events_for_user(user_id, top_n)
+    context = await load_recommendation_context_async(user_id, index, user_data, liked_event_refs)
+    recommendations = await asyncio.to_thread(rank_events, context, index, top_n) if context is not None else []
+    if recommendations:
+        recommendation_cache.set(user_id, key, recommendations)
+        if recommendation_cache.persist:
+            try:
+                await async_db.collection("users").document(user_id).update(
+                    recommendation_cache.persisted_update(key, recommendations))
+            except Exception as e:
+                print(f"[RecommendationCache] ⚠️ Could not persist recommendations for {user_id}: {e}")
+    return recommendations
 
 if __name__ == "__main__":
-    # print(len(get_recommendations("5DAGbcxFASgjsUNm15nP3AIlMYu1")))
-    print(len(get_recommendations("Ybd9Xb0IsDPdDGySzeXv56D7znJ3")))
\ No newline at end of file
+    # print(len(asyncio.run(get_recommendations_async("5DAGbcxFASgjsUNm15nP3AIlMYu1"))))
+    print(len(asyncio.run(get_recommendations_async("Ybd9Xb0IsDPdDGySzeXv56D7znJ3"))))
@@ -1,20 +1,42 @@
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
 
-def score_event_by_components(aggregated_profile, event_components, field_names):
+def score_events_by_components(aggregated_profile, event_vectors, event_lengths, event_norms, field_names):
     """
-    cosine similarity calculation
+    cosine similarity of the profile with every event, averaged over the fields whose
+    dimensionality matches, computed on field-stacked event matrices
 
-    :param aggregated_profile:
-    :param event_components:
-    :return: avg score
+    :param aggregated_profile: field -> profile vector
+    :param event_vectors: field -> (n_events, dim) dense or CSR matrix, rows zero-padded to the longest vector
+    :param event_lengths: field -> real length of each row
+    :param event_norms: field -> L2 norm of each row
+    :return: array of avg scores, one per event
     """
-    scores = []
+    n_events = len(next(iter(event_lengths.values()))) if event_lengths else 0
+    totals = np.zeros(n_events)
+    counts = np.zeros(n_events)
+
     for field in field_names:
-        user_vec = np.array(aggregated_profile[field]).reshape(1, -1)
-        event_vec = np.array(event_components.get(field, [])).reshape(1, -1)
-        if user_vec.shape == event_vec.shape and user_vec.shape[1] > 0:
-            sim = cosine_similarity(user_vec, event_vec)[0][0]
-            scores.append(sim)
-    return np.mean(scores) if scores else 0
\ No newline at end of file
+        if field not in event_vectors:
+            continue
+        user_vec = np.asarray(aggregated_profile[field], dtype=np.float32).ravel()
+        dim = user_vec.shape[0]
+        matrix = event_vectors[field]
+        if dim == 0 or dim > matrix.shape[1]:
+            continue
+
+        # поля з іншою розмірністю (інший словник) не враховуються в середньому
+        matched = event_lengths[field] == dim
+        if not matched.any():
+            continue
+
+        if dim < matrix.shape[1]:
+            matrix = matrix[:, :dim]
+        dots = np.asarray(matrix @ user_vec).ravel()
+        denom = event_norms[field] * np.linalg.norm(user_vec)
+        sims = np.divide(dots, denom, out=np.zeros(n_events), where=denom > 0)
+
+        totals[matched] += sims[matched]
+        counts[matched] += 1
+
+    return np.divide(totals, counts, out=np.zeros(n_events), where=counts > 0)
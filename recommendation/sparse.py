@@ -0,0 +1,91 @@
+from typing import List
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def encode_sparse(vector) -> dict:
+    """
+    compact storage form of a component vector: {"dim", "indices", "values"}.
+    accepts a dense sequence or a 1-row sparse matrix.
+    """
+    if hasattr(vector, "tocsr"):
+        row = vector.tocsr()
+        order = np.argsort(row.indices)
+        return {
+            "dim": int(row.shape[1]),
+            "indices": row.indices[order].astype(int).tolist(),
+            "values": row.data[order].astype(float).tolist(),
+        }
+
+    dense = np.asarray(vector, dtype=float).ravel()
+    nonzero = np.flatnonzero(dense)
+    return {
+        "dim": int(dense.shape[0]),
+        "indices": nonzero.tolist(),
+        "values": dense[nonzero].tolist(),
+    }
+
+
+def encode_sparse_rows(matrix) -> List[dict]:
+    """
+    encodes every row of a CSR matrix without densifying it
+    """
+    matrix = csr_matrix(matrix)
+    matrix.sort_indices()
+    return [
+        {
+            "dim": int(matrix.shape[1]),
+            "indices": matrix.indices[start:end].astype(int).tolist(),
+            "values": matrix.data[start:end].astype(float).tolist(),
+        }
+        for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:])
+    ]
+
+
+def is_sparse(value) -> bool:
+    return isinstance(value, dict) and "dim" in value
+
+
+def vector_length(value) -> int:
+    if value is None:
+        return 0
+    return int(value["dim"]) if is_sparse(value) else len(value)
+
+
+def decode_dense(value) -> np.ndarray:
+    """
+    dense vector from a stored value (sparse encoding or a legacy dense list)
+    """
+    if not is_sparse(value):
+        return np.asarray(value if value is not None else [], dtype=float)
+    dense = np.zeros(int(value["dim"]))
+    dense[value["indices"]] = value["values"]
+    return dense
+
+
+def stack_csr(values: list, n_cols: int) -> csr_matrix:
+    """
+    builds a float32 CSR matrix straight from stored values (sparse encodings, legacy dense
+    lists or None for empty rows); shorter rows are implicitly zero-padded to n_cols
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    for value in values:
+        if value is None:
+            pass
+        elif is_sparse(value):
+            indices.extend(value["indices"])
+            data.extend(value["values"])
+        else:
+            dense = np.asarray(value, dtype=float)
+            nonzero = np.flatnonzero(dense)
+            indices.extend(nonzero.tolist())
+            data.extend(dense[nonzero].tolist())
+        indptr.append(len(indices))
+
+    return csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(values), n_cols),
+    )
@@ -1,15 +1,20 @@
+import asyncio
 import re
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from typing import Optional, Tuple
 
-import numpy as np
 from google.cloud import firestore
 from sklearn.preprocessing import minmax_scale
 
-from app.config import CATEGORY_TRANSLATION, GENRE_TRANSLATION
-from recommendation.scoring import score_event_by_components
+from app.config import CATEGORY_TRANSLATION, GENRE_TRANSLATION, LAST_ACTIVE_UPDATE_MINUTES
+from recommendation.cache import recommendation_cache
+from recommendation.event_index import get_event_index, reproject_events
+from recommendation.feature_space import get_feature_space
+from recommendation.ranking import top_n_ids
+from recommendation.scoring import score_events_by_components
+from recommendation.sparse import decode_dense
 from recommendation.vectorizer import genre_vector, category_vector
-from services.firestore_client import db
+from services.firestore_client import async_db
 
 
 def geocode_address(address: str) -> Optional[Tuple[float, float]]:
@@ -25,15 +30,62 @@ def get_city_from_address(address):
 
 
 
-def build_profile_vector(user_id):
+def profile_versions(fields):
     """
-        creates profile vector for new user based on interests from onboarding responses
+    feature-space versions to store next to profile vectors
     """
-    onboarding_doc = db.collection("onboardingResponses").document(user_id).get()
-    if not onboarding_doc.exists:
-        return None
+    space = get_feature_space()
+    if space is None:
+        return {}
+    return {field: space.field_versions[field] for field in fields if field in space.field_versions}
+
+
+def compatible_profile_components(user_data):
+    """
+    profile vectors built in the current feature space; fields of another version are dropped.
+
+    main_categories written before versioning (or while no space existed) are kept: the category
+    order was always fixed, so only genres of such profiles are dropped. the version stamp of the
+    field is added with the next profile write (see profile_versions).
+    """
+    profile = user_data.get("component_profile_vectors") or {}
+    space = get_feature_space()
+    if space is None:
+        return profile
+
+    versions = user_data.get("component_profile_versions") or {}
+    compatible = {}
+    for field, vector in profile.items():
+        version = versions.get(field)
+        if version == space.field_versions.get(field):
+            compatible[field] = vector
+        elif version is None and field == "main_categories" and len(vector or []) == len(space.categories):
+            compatible[field] = vector
+    return compatible
+
+
+def last_active_due(user_data) -> bool:
+    last_active = user_data.get("last_active")
+    now = datetime.now(timezone.utc)
+    return not (isinstance(last_active, datetime) and now - last_active < timedelta(minutes=LAST_ACTIVE_UPDATE_MINUTES))
 
-    onboarding = onboarding_doc.to_dict()
+
+async def touch_last_active_async(user_id, user_data):
+    """
+    marks the user as active (for recommendation precomputation); written at most once per LAST_ACTIVE_UPDATE_MINUTES
+    """
+    if not last_active_due(user_data):
+        return
+    try:
+        await async_db.collection("users").document(user_id).update({"last_active": datetime.now(timezone.utc)})
+    except Exception as e:
+        print(f"[Profile] ⚠️ Could not update last_active for {user_id}: {e}")
+
+
+def profile_from_onboarding(onboarding):
+    """
+    profile components from onboarding responses
+    """
     answers = onboarding.get("answers", {})
 
     # translate and normalize
@@ -50,38 +102,13 @@ def build_profile_vector(user_id):
     for field, selected_items in profile_texts.items():
         vector = genre_vector(selected_items) if field == "genres" else category_vector(selected_items)
         profile_components[field] = vector
-
-    # print(profile_components)
-    db.collection("users").document(user_id).update({
-        "component_profile_vectors": profile_components
-    })
     return profile_components
 
-def update_profile_vector(user_id, event_id, alpha = 0.7):
-    """
-    updates the user profile vector by integrating the last-liked event using exponential smoothing.
 
-    :param event_id: last liked event
-    :param alpha: weight
+def smoothed_profile(profile, event_data, alpha):
+    """
+    profile components after exponential smoothing with the event's vectors
     """
-    from sklearn.preprocessing import minmax_scale
-
-    user_doc = db.collection("users").document(user_id).get()
-    if not user_doc.exists:
-        return None
-    user_data = user_doc.to_dict()
-    profile = user_data.get("component_profile_vectors")
-    if not profile:
-        profile = build_profile_vector(user_id)
-        if not profile:
-            return None
-
-    # нова подія
-    event_doc = db.collection("events").document(event_id).get()
-    if not event_doc.exists:
-        return None
-    event_data = event_doc.to_dict()
-
     event_vector = {
         "main_categories": category_vector(event_data.get("main_categories", [])),
         "genres": genre_vector(event_data.get("genres", []))
@@ -102,73 +129,121 @@ def update_profile_vector(user_id, event_id, alpha = 0.7):
             thresholded = [v if v > 0.02 else 0 for v in normalized]
             total_thresh = sum(thresholded)
             updated_profile[key] = [v / total_thresh for v in thresholded] if total_thresh > 0 else thresholded
+    return updated_profile
 
-    # Зберігаємо
-    db.collection("users").document(user_id).update({
-        "component_profile_vectors": updated_profile
-    })
 
-    return updated_profile
+def profile_update(profile_components):
+    return {
+        "component_profile_vectors": profile_components,
+        "component_profile_versions": profile_versions(profile_components),
+        "recommendations_revision": firestore.Increment(1),
+    }
 
 
+async def save_profile_async(user_id, profile_components):
+    update = await asyncio.to_thread(profile_update, profile_components)
+    await async_db.collection("users").document(user_id).update(update)
+    recommendation_cache.invalidate(user_id)
 
-def get_similar_to_last_liked(user_id, top_n=10):
+
+async def build_profile_vector_async(user_id):
     """
-    returns similar events to the user's last-liked event
+    creates profile vector for new user based on interests from onboarding responses;
+    the feature space (which may be loaded from Firestore) is used in a thread
     """
-    fav_ref = db.collection("users").document(user_id).collection("favourite_events")
-    fav_docs = list(fav_ref.order_by("date_created", direction=firestore.Query.DESCENDING).limit(1).stream())
+    onboarding_doc = await async_db.collection("onboardingResponses").document(user_id).get()
+    if not onboarding_doc.exists:
+        return None
 
-    if not fav_docs:
-        return []
+    profile_components = await asyncio.to_thread(profile_from_onboarding, onboarding_doc.to_dict())
+    await save_profile_async(user_id, profile_components)
+    return profile_components
 
-    last_fav_id = fav_docs[0].to_dict().get("id")
-    if not last_fav_id:
-        return []
 
-    event_doc = db.collection("events").document(last_fav_id).get()
+async def update_profile_vector_async(user_id, event_id, alpha=0.7):
+    """
+    updates the user profile vector by integrating the last-liked event using exponential smoothing.
+    the user and the event are read concurrently, profile math that needs the feature space runs in a thread
+
+    :param event_id: last liked event
+    :param alpha: weight
+    """
+    user_doc, event_doc = await asyncio.gather(
+        async_db.collection("users").document(user_id).get(),
+        async_db.collection("events").document(event_id).get(),
+    )
+    if not user_doc.exists:
+        return None
+    profile = await asyncio.to_thread(compatible_profile_components, user_doc.to_dict())
+    if not profile:
+        profile = await build_profile_vector_async(user_id)
+        if not profile:
+            return None
     if not event_doc.exists:
-        return []
+        return None
 
-    base_event = event_doc.to_dict()
+    updated_profile = await asyncio.to_thread(smoothed_profile, profile, event_doc.to_dict(), alpha)
+    await save_profile_async(user_id, updated_profile)
+    return updated_profile
+
+
+async def liked_event_ids_async(user_id):
+    favourites = async_db.collection("users").document(user_id).collection("favourite_events")
+    return [doc.to_dict().get("id") async for doc in favourites.stream()]
 
-    if "component_vectors" not in base_event:
-        return []
 
-    # вектори останньої лайкнутої події
-    base_components = base_event["component_vectors"]
+def similar_to_event_data(index, base_event, top_n):
+    """
+    brute-force similar events for an event outside the index
+    """
+    space = get_feature_space()
+    if space is not None:
+        reproject_events([base_event], space)
+    if not base_event.get("component_vectors"):
+        return []
+    base_components = {k: decode_dense(v) for k, v in base_event["component_vectors"].items()}
     field_names = base_components.keys()
-    base_components = {k: np.array(v) for k, v in base_components.items()}
 
     # майбутні події
-    events_docs = db.collection("events").stream()
-
-    events = []
-    for doc in events_docs:
-        e = doc.to_dict()
-        if "component_vectors" not in e:
-            continue
-        # if not isinstance(e.get("endTime"), datetime) or e["endTime"] < datetime.now(timezone.utc):
-        #     continue
-        if e.get("id") == last_fav_id:
-            continue
-        events.append(e)
+    scores = score_events_by_components(base_components, index.vectors, index.lengths, index.norms, field_names)
 
     # схожість
-    scored = []
-    for event in events:
-        ev_vecs = {k: np.array(v) for k, v in event["component_vectors"].items() if k in field_names}
+    return top_n_ids(scores, index.ids, top_n)
 
-        score = score_event_by_components(base_components, ev_vecs, field_names)
-        scored.append((score, event))
 
-    scored.sort(reverse=True, key=lambda x: x[0])
-    similar_ids = [e["id"] for score, e in scored[:top_n]]
-    return similar_ids, last_fav_id
+async def get_similar_to_last_liked_async(user_id, top_n=10):
+    """
+    returns similar events to the user's last-liked event; index loading and neighbour lookups
+    (which may fall back to an exact scan) run in a thread
+    """
+    fav_ref = async_db.collection("users").document(user_id).collection("favourite_events")
+    query = fav_ref.order_by("date_created", direction=firestore.Query.DESCENDING).limit(1)
+    fav_docs = [doc async for doc in query.stream()]
+
+    if not fav_docs:
+        return [], None
+
+    last_fav_id = fav_docs[0].to_dict().get("id")
+    if not last_fav_id:
+        return [], None
+
+    index = await asyncio.to_thread(get_event_index)
+    row = index.positions.get(last_fav_id)
+
+    # подія в індексі - готові сусіди
+    if row is not None:
+        similar_rows = await asyncio.to_thread(index.similar_rows, row, top_n)
+        return [index.ids[j] for j in similar_rows], last_fav_id
+
+    # подія поза індексом - вектори з Firestore і повний перебір
+    event_doc = await async_db.collection("events").document(last_fav_id).get()
+    if not event_doc.exists:
+        return [], last_fav_id
+    return await asyncio.to_thread(similar_to_event_data, index, event_doc.to_dict(), top_n), last_fav_id
 
 if __name__ == "__main__":
-    print(get_similar_to_last_liked("5DAGbcxFASgjsUNm15nP3AIlMYu1"))
-    # print(update_profile_vector(
+    print(asyncio.run(get_similar_to_last_liked_async("5DAGbcxFASgjsUNm15nP3AIlMYu1")))
+    # print(asyncio.run(update_profile_vector_async(
     #     "5DAGbcxFASgjsUNm15nP3AIlMYu1",
-    #     "L2F1dGhvcml0eS9ob3Jpem9uL2NsdXN0ZXJlZF9ldmVudC8yMDI1LTA0LTI2fDEwMDM1NTU5OTk3MDA0MjA2Nzk4"))
+    #     "L2F1dGhvcml0eS9ob3Jpem9uL2NsdXN0ZXJlZF9ldmVudC8yMDI1LTA0LTI2fDEwMDM1NTU5OTk3MDA0MjA2Nzk4")))
 
@@ -1,10 +1,13 @@
 import json
 from typing import List
 
-from app.config import ALL_GENRES, ALL_CATEGORIES
-from app.models import Event
-from services.firestore_client import db
-from sklearn.feature_extraction.text import TfidfVectorizer
+import time
+
+from app.config import ALL_GENRES, ALL_CATEGORIES, FEATURE_SPACE_REFIT_GROWTH, FEATURE_SPACE_REFIT_DAYS
+from app.models import Event, SparseVector
+from recommendation.feature_space import FeatureSpace, fit_feature_space, get_feature_space, save_feature_space
+from recommendation.sparse import encode_sparse, is_sparse
+from services.firestore_client import db, count_events, get_all_events, update_event_vectors
 
 from services.transformers import transform_events
 
@@ -13,20 +16,28 @@ def category_vector(selected_categories):
     """
     Створює вектор для вибраних категорій на основі фіксованого списку.
     """
-    return [1 if category in selected_categories else 0 for category in ALL_CATEGORIES]
+    space = get_feature_space()
+    categories = space.categories if space else ALL_CATEGORIES
+    return [1 if category in selected_categories else 0 for category in categories]
 
 def genre_vector(selected_genres):
     """
     Створює вектор для вибраних жанрів на основі фіксованого списку.
     """
-    return [1 if genre in selected_genres else 0 for genre in ALL_GENRES]
-
+    space = get_feature_space()
+    genres = space.genres if space else ALL_GENRES
+    return [1 if genre in selected_genres else 0 for genre in genres]
 
-def vectorize_field(texts, stop_words="english"):
 
-    vectorizer = TfidfVectorizer(stop_words=stop_words)
-    matrix = vectorizer.fit_transform(texts)
-    return matrix.toarray(), vectorizer
+def ensure_feature_space(raw_events) -> FeatureSpace:
+    """
+    returns the persisted feature space, fitting and saving it on the given events if there is none yet
+    """
+    space = get_feature_space()
+    if space is None:
+        space = fit_feature_space(raw_events)
+        save_feature_space(space)
+    return space
 
 
 def build_event_components(event):
@@ -36,7 +47,7 @@ def build_event_components(event):
         "main_categories": " ".join(event.get("main_categories", [])),
         "genres": " ".join(event.get("genres", [])),
         # "venue_name": event.get("venue", {}).get("name", ""),
-        "venue_subtypes": " ".join(event.get("venue", {}).get("subtypes", [])),
+        "venue_subtypes": " ".join((event.get("venue") or {}).get("subtypes", [])),
         "isVirtual": "virtual" if event.get("isVirtual") else ""
     }
     return {k: v.lower() for k, v in fields.items()}
@@ -59,7 +70,7 @@ def extract_event_fields_for_vectorization(event):
         "genres": get_text(event.get("genres", [])),
         "isVirtual": get_text(event.get("isVirtual", False)),
         # "venue_name": get_text(event.get("venue", {}).get("name", "")),
-        "venue_subtypes": get_text(event.get("venue", {}).get("subtypes", []))
+        "venue_subtypes": get_text((event.get("venue") or {}).get("subtypes", []))
     }
 
 
@@ -67,67 +78,85 @@ def extract_event_fields_for_vectorization(event):
 
 def generate_events_vectors(events: List[Event]):
     raw_events = [extract_event_fields_for_vectorization(e.model_dump()) for e in events]
-    field_names = raw_events[0].keys()
-
-
-    field_vectors = {}
-    vectorizers = {}
-
-    for field in field_names:
-        if field == "main_categories":
-            field_vectors[field] = [category_vector(e[field]) for e in raw_events]
-        elif field == "genres":
-            field_vectors[field] = [genre_vector(e[field]) for e in raw_events]
-        else:
-            # TfidfVectorizer
-            texts = [e[field].lower() for e in raw_events]
-            vectors, vec = vectorize_field(texts)
-            field_vectors[field] = vectors
-            vectorizers[field] = vec
-
-    for i, event in enumerate(events):
-        component_vectors = {
-            field: field_vectors[field][i] if isinstance(field_vectors[field][i], list) else field_vectors[field][i].tolist()
-            for field in field_names
-        }
-        event.component_vectors = component_vectors
+    if not raw_events:
+        return events
+
+    space = ensure_feature_space(raw_events)
+    for event, component_vectors in zip(events, space.vectorize(raw_events)):
+        event.component_vectors = {field: SparseVector(**v) for field, v in component_vectors.items()}
+        event.vector_version = space.version
 
     return events
 
-# update already existing events
-def generate_component_vectors_from_firestore():
-    events = list(db.collection("events").stream())
+def feature_space_is_stale(space: FeatureSpace, catalogue_size: int) -> bool:
+    """
+    a space fitted on a much smaller catalogue (e.g. the first batch of a sync into an empty store)
+    or long ago has no vocabulary for most current events
+    """
+    return (catalogue_size >= space.fitted_on * FEATURE_SPACE_REFIT_GROWTH
+            or time.time() - space.fitted_at > FEATURE_SPACE_REFIT_DAYS * 24 * 3600)
+
+
+def refit_feature_space(events: List[dict]) -> FeatureSpace:
+    """
+    fits the feature space on the whole catalogue, publishes it and writes the re-vectorized events back
+    """
+    raw_events = [extract_event_fields_for_vectorization(e) for e in events]
+    space = fit_feature_space(raw_events)
+    save_feature_space(space)
+
+    for event, component_vectors in zip(events, space.vectorize(raw_events)):
+        event["component_vectors"] = component_vectors
+        event["vector_version"] = space.version
+    updated = update_event_vectors(events)
+    print(f"[FeatureSpace] ✅ Refitted on {len(events)} events, {updated} re-vectorized ({space.version}).")
+    return space
+
+
+def refit_feature_space_if_stale() -> bool:
+    """
+    called after a sync: refits the space on the whole stored catalogue when feature_space_is_stale
+    """
+    space = get_feature_space()
+    if space is not None and not feature_space_is_stale(space, count_events()):
+        return False
+    events = get_all_events()
     if not events:
-        return
-
-    raw_events = [extract_event_fields_for_vectorization(e.to_dict()) for e in events]
-    field_names = raw_events[0].keys()
-
-    field_vectors = {}
-    vectorizers = {}
-
-    for field in field_names:
-        if field == "main_categories":
-            field_vectors[field] = [category_vector(e[field]) for e in raw_events]
-        elif field == "genres":
-            field_vectors[field] = [genre_vector(e[field]) for e in raw_events]
-        else:
-            # TfidfVectorizer
-            texts = [e[field].lower() for e in raw_events]
-            vectors, vec = vectorize_field(texts)
-            field_vectors[field] = vectors
-            vectorizers[field] = vec
-
-    for doc, original, i in zip(events, raw_events, range(len(events))):
-        component_vectors = {
-            field: field_vectors[field][i] if isinstance(field_vectors[field][i], list) else field_vectors[field][i].tolist()
-            for field in field_names
-        }
-        db.collection("events").document(doc.id).update({
-            "component_vectors": component_vectors
-        })
-
-    print("✅ Component vectors added to Firestore events.")
+        return False
+    refit_feature_space(events)
+    return True
+
+# update already existing events: refits the feature space on the whole catalogue and re-vectorizes it
+def generate_component_vectors_from_firestore():
+    events = get_all_events()
+    if events:
+        refit_feature_space(events)
+
+# convert dense component_vectors of already existing events to the sparse format
+def migrate_component_vectors_to_sparse(batch_size: int = 400):
+    batch = db.batch()
+    pending = 0
+    migrated = 0
+
+    for doc in db.collection("events").stream():
+        component_vectors = doc.to_dict().get("component_vectors") or {}
+        if not component_vectors or all(is_sparse(v) for v in component_vectors.values()):
+            continue
+
+        encoded = {field: v if is_sparse(v) else encode_sparse(v) for field, v in component_vectors.items()}
+        batch.update(doc.reference, {"component_vectors": encoded})
+        pending += 1
+        migrated += 1
+
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"✅ Migrated component vectors of {migrated} events to the sparse format.")
 
 # update already existing events if 4a file to test
 def generate_component_vectors_from_file(filepath):
@@ -135,29 +164,11 @@ def generate_component_vectors_from_file(filepath):
         events = json.load(f)
 
     raw_events = [extract_event_fields_for_vectorization(e) for e in events]
-    field_names = raw_events[0].keys()
-
-    field_vectors = {}
-    vectorizers = {}
-
-    for field in field_names:
-        if field == "main_categories":
-            field_vectors[field] = [category_vector(e[field]) for e in raw_events]
-        elif field == "genres":
-            field_vectors[field] = [genre_vector(e[field]) for e in raw_events]
-        else:
-            # TfidfVectorizer
-            texts = [e[field].lower() for e in raw_events]
-            vectors, vec = vectorize_field(texts)
-            field_vectors[field] = vectors
-            vectorizers[field] = vec
-
-    for i, event in enumerate(events):
-        component_vectors = {
-            field: field_vectors[field][i] if isinstance(field_vectors[field][i], list) else field_vectors[field][i].tolist()
-            for field in field_names
-        }
+    space = ensure_feature_space(raw_events)
+
+    for event, component_vectors in zip(events, space.vectorize(raw_events)):
         event["component_vectors"] = component_vectors
+        event["vector_version"] = space.version
 
     return events
 
@@ -0,0 +1,90 @@
+# python -m services.benchmark_save_events
+# офлайн-бенчмарк save_events: без Firestore, затримка коміту і збої імітуються фейковим клієнтом
+import random
+import threading
+import time
+from typing import List
+
+from services.firestore_client import save_events
+
+COMMIT_LATENCY_SECONDS = 0.05
+LATENCY_PER_WRITE_SECONDS = 0.0002
+EVENTS_COUNT = 2000
+
+
+class FakeEvent:
+    def __init__(self, event_id: str):
+        self.id = event_id
+
+    def model_dump(self) -> dict:
+        return {"id": self.id, "name": f"Event {self.id}"}
+
+
+class FakeBatch:
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data):
+        self._writes.append((ref, data))
+
+    def commit(self):
+        self._client.commit(self._writes)
+
+
+class FakeClient:
+    """
+    enough of the Firestore client for save_events: a commit takes a fixed latency plus a per-write cost
+    and fails with failure_rate, like a batch rejected by Firestore
+    """
+
+    def __init__(self, latency: float = COMMIT_LATENCY_SECONDS, per_write: float = LATENCY_PER_WRITE_SECONDS,
+                 failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.per_write = per_write
+        self.failure_rate = failure_rate
+        self.commits = 0
+        self.stored = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def collection(self, name: str):
+        return self
+
+    def document(self, document_id: str) -> str:
+        return document_id
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def commit(self, writes: list):
+        time.sleep(self.latency + self.per_write * len(writes))
+        with self._lock:
+            self.commits += 1
+            if self._random.random() < self.failure_rate:
+                raise RuntimeError("simulated commit failure")
+            self.stored.update(writes)
+
+
+def benchmark(events: List[FakeEvent], batch_size: int, workers: int, failure_rate: float = 0.0) -> dict:
+    client = FakeClient(failure_rate=failure_rate)
+    started = time.perf_counter()
+    summary = save_events(events, client=client, batch_size=batch_size, workers=workers)
+    seconds = time.perf_counter() - started
+    return {
+        "batch_size": batch_size,
+        "workers": workers,
+        "seconds": round(seconds, 2),
+        "events_per_second": round(len(events) / seconds),
+        "commits": client.commits,
+        "written": len(summary["written"]),
+        "failed": len(summary["failed"]),
+    }
+
+
+if __name__ == "__main__":
+    sample = [FakeEvent(f"event-{i}") for i in range(EVENTS_COUNT)]
+    for batch_size, workers in [(1, 8), (100, 1), (500, 1), (100, 4), (500, 4)]:
+        print(benchmark(sample, batch_size, workers))
+    # збій коміту повторюється з backoff; після FIRESTORE_MAX_RETRIES невдалим вважається весь чанк
+    print(benchmark(sample, 500, 4, failure_rate=0.3))
@@ -0,0 +1,37 @@
+import re
+from typing import Dict, Iterable, Iterator, Optional
+
+from app.config import city_translation_map, city_inflected_forms
+
+
+class CityLocalizer:
+    """
+    replaces English city names (and transliterated inflected Ukrainian forms) with Ukrainian ones.
+
+    the matcher is compiled once; alternatives are ordered longest first, so
+    "Kamianets-Podilskyi" wins over "Kamianets" and "Kyieva" over "Kyiv".
+    """
+
+    def __init__(self, translations: Dict[str, str], inflected_forms: Optional[Dict[str, str]] = None):
+        self.translations = translations
+        self.forms = {**(inflected_forms or {}), **translations}
+        names = sorted(self.forms, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b")
+
+    def translate_city(self, city: str) -> str:
+        return self.translations.get(city.strip(), city)
+
+    def replace(self, text: str) -> str:
+        if not text:
+            return text
+        return self.pattern.sub(lambda match: self.forms[match.group(0)], text)
+
+    def replace_iter(self, texts: Iterable[str]) -> Iterator[str]:
+        """
+        lazily localizes a stream of texts
+        """
+        for text in texts:
+            yield self.replace(text)
+
+
+city_localizer = CityLocalizer(city_translation_map, city_inflected_forms)
@@ -1,9 +1,15 @@
-from app.config import EVENTS_API_URL, RAPIDAPI_KEY, RAPIDAPI_HOST
-from categorization.event_categorization import assign_categories_to_events
-from recommendation.vectorizer import generate_events_vectors
-from services.transformers import transform_events
-from services.firestore_client import save_events
+import hashlib
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import EVENTS_API_URL, RAPIDAPI_KEY, RAPIDAPI_HOST, RAPIDAPI_REQUESTS_PER_SECOND, \
+    RAPIDAPI_MAX_RETRIES, FETCH_WORKERS
+from services.rate_limit import TokenBucket
+from services.firestore_client import get_stored_hashes
 import requests
+from requests.adapters import HTTPAdapter
 
 HEADERS = {
     "x-rapidapi-key": RAPIDAPI_KEY,
@@ -35,7 +41,47 @@ OTHER_CITIES = [
 
 DATE = "next_month"
 
-def fetch_events_for_query(query: str, offset: int = 0, date: str = DATE, is_virtual: bool = False) -> list:
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_SECONDS = 1.0
+REQUEST_TIMEOUT_SECONDS = 30
+
+# спільна сесія з пулом з'єднань і загальний ліміт запитів до RapidAPI для всіх потоків
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS))
+rapidapi_budget = TokenBucket(RAPIDAPI_REQUESTS_PER_SECOND)
+
+
+def get_with_retry(params: dict) -> requests.Response:
+    """
+    GET to the events API under the shared request budget, retrying 429/5xx and connection errors with backoff
+    """
+    for attempt in range(RAPIDAPI_MAX_RETRIES + 1):
+        rapidapi_budget.acquire()
+        try:
+            response = session.get(EVENTS_API_URL, headers=HEADERS, params=params, timeout=REQUEST_TIMEOUT_SECONDS)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == RAPIDAPI_MAX_RETRIES:
+                raise
+            delay = None
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == RAPIDAPI_MAX_RETRIES:
+                response.raise_for_status()
+                return response
+            delay = response.headers.get("Retry-After")
+
+        try:
+            delay = float(delay)
+        except (TypeError, ValueError):
+            delay = BACKOFF_SECONDS * 2 ** attempt + random.uniform(0, BACKOFF_SECONDS)
+        print(f"Retrying {params.get('query')} (offset {params.get('start')}) in {delay:.1f}s")
+        time.sleep(delay)
+
+def fetch_events_for_query(query: str, offset: int = 0, date: str = DATE, is_virtual: bool = False,
+                           raise_errors: bool = False) -> list:
+    """
+    one page of raw events; a request that still fails after retries gives an empty page,
+    or is raised with raise_errors
+    """
     params = {
         "query": query,
         "date": date,
@@ -46,74 +92,117 @@ def fetch_events_for_query(query: str, offset: int = 0, date: str = DATE, is_vir
         params["is_virtual"] = "true"
 
     try:
-        response = requests.get(EVENTS_API_URL, headers=HEADERS, params=params)
-        response.raise_for_status()
+        response = get_with_retry(params)
         data = response.json().get("data", [])
         print(f"Fetched {len(data)} events for {query} (offset {offset})")
     except requests.RequestException as e:
+        if raise_errors:
+            raise
         print(f"Error fetching events for {query}: {e}")
         return []
 
-    enriched = assign_categories_to_events(data)
-    return enriched
+    return data
 
-def fetch_and_store_events():
-    all_events = []
+def build_sync_queries() -> list:
+    """
+    (query, max_pages, is_virtual) for every location of a sync
+    """
+    queries = []
 
     # обробка з кількома сторінками
     for location_group in [BIG_CITIES, REGIONS]:
-        events = fetch_events_from_locations(location_group)
-        all_events.extend(events)
+        queries.extend((location, max_pages, False) for location, max_pages in location_group.items())
 
     # 1 сторінка
-    other_events = fetch_events_from_single_page(OTHER_CITIES)
-    all_events.extend(other_events)
+    queries.extend((city, 1, False) for city in OTHER_CITIES)
 
     # онлайн події
-    online_events = fetch_events_for_query("ukraine", is_virtual = True)
-    all_events.extend(online_events)
+    queries.append(("ukraine", 1, True))
+    return queries
 
-    print(f"Total raw events fetched: {len(all_events)}")
 
-    # обробка та збереження
-    parsed_events = transform_events(all_events)
-    enriched_events = generate_events_vectors(parsed_events)
-    save_events(enriched_events)
-    print(f"Saved {len(parsed_events)} parsed events to Firestore.")
+def fetch_and_store_events(progress: dict = None):
+    # потоковий конвеєр: fetch → categorize → translate → vectorize → write
+    from services.pipeline import run_sync_pipeline
+
+    return run_sync_pipeline(build_sync_queries(), progress=progress)
+
+
+def payload_hash(raw: dict) -> str:
+    """
+    hash of the raw RapidAPI payload of one event, independent of key order
+    """
+    payload = json.dumps(raw, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def detect_changes(raw_events: list) -> dict:
+    """
+    splits fetched events (deduplicated by event_id, first occurrence wins) into new and changed ones
+    by comparing payload hashes with the stored source_hash
+
+    :return: {"new": [...], "changed": [...], "unchanged": count, "hashes": {event_id: hash}}
+    """
+    unique = {}
+    for raw in raw_events:
+        if raw.get("event_id") and raw["event_id"] not in unique:
+            unique[raw["event_id"]] = raw
+
+    hashes = {event_id: payload_hash(raw) for event_id, raw in unique.items()}
+    stored = get_stored_hashes(list(unique))
+
+    changes = {"new": [], "changed": [], "unchanged": 0, "hashes": hashes}
+    for event_id, raw in unique.items():
+        if event_id not in stored:
+            changes["new"].append(raw)
+        elif stored[event_id] != hashes[event_id]:
+            changes["changed"].append(raw)
+        else:
+            changes["unchanged"] += 1
+    return changes
+
+
+def fetch_queries(queries: list) -> list:
+    """
+    runs pagination chains of (query, max_pages, is_virtual) in parallel;
+    pages of one query stay sequential, results keep the order of queries
+    """
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        results = executor.map(lambda q: fetch_paginated_events(*q), queries)
+        return [event for events in results for event in events]
 
 
 def fetch_events_from_locations(locations: dict) -> list:
-    all_events = []
-    for location, max_pages in locations.items():
-        location_events = fetch_paginated_events(location, max_pages)
-        all_events.extend(location_events)
-    return all_events
+    return fetch_queries([(location, max_pages, False) for location, max_pages in locations.items()])
+
+
+def fetch_paginated_events(query: str, max_pages: int, is_virtual: bool = False) -> list:
+    return [event for page in iter_query_pages(query, max_pages, is_virtual) for event in page]
+
 
+def iter_query_pages(query: str, max_pages: int, is_virtual: bool = False, raise_errors: bool = False):
+    """
+    yields pages of raw events of one query as soon as they are fetched
 
-def fetch_paginated_events(query: str, max_pages: int) -> list:
-    all_events = []
+    :param raise_errors: raise request errors instead of ending the query, so the caller can mark it failed
+    """
     for page in range(max_pages):
         offset = page * 10
-        events = fetch_events_for_query(query, offset)
+        events = fetch_events_for_query(query, offset, is_virtual=is_virtual, raise_errors=raise_errors)
 
         if not events:
             print(f"No events returned for {query} at offset {offset}.")
             break
 
-        all_events.extend(events)
+        yield events
 
         if len(events) < 10:
             print(f"Less than 10 events found for {query}, stopping further fetches.")
             break
-    return all_events
 
 
 def fetch_events_from_single_page(cities: list) -> list:
-    all_events = []
-    for city in cities:
-        events = fetch_events_for_query(city)
-        all_events.extend(events)
-    return all_events
+    return fetch_queries([(city, 1, False) for city in cities])
 
 if __name__ == "__main__":
     fetch_and_store_events()
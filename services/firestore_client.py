@@ -1,15 +1,26 @@
 import asyncio
 import json
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
 
 import firebase_admin
 
 from services import transformers
-from app.config import FIREBASE_CREDENTIALS_PATH, SETTINGS_COLLECTION, DOC_ID
+from app.config import FIREBASE_CREDENTIALS_PATH, SETTINGS_COLLECTION, DOC_ID, CATALOGUE_DOC_ID, \
+    FEATURE_SPACE_DOC_ID, FIRESTORE_EMULATOR_HOST, FIRESTORE_PROJECT_ID, FIRESTORE_BATCH_SIZE, \
+    FIRESTORE_WRITE_WORKERS, FIRESTORE_MAX_RETRIES
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 
 from app.models import Event
-from typing import List
+from typing import Dict, List, Optional
+
+# максимум значень в одному фільтрі "in"
+FIRESTORE_IN_QUERY_LIMIT = 30
+# документ Firestore не більший за 1 МіБ, тож великі артефакти пишуться частинами
+BLOB_CHUNK_BYTES = 900_000
 
 
 # os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = FIREBASE_CREDENTIALS_PATH
@@ -17,11 +28,63 @@ from typing import List
 # cred = credentials.Certificate(os.environ["GOOGLE_APPLICATION_CREDENTIALS"])
 # initialize_app(cred)
 # db = firestore.Client()
-if not firebase_admin._apps:
-    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-    firebase_admin.initialize_app(cred)
+def create_client():
+    if FIRESTORE_EMULATOR_HOST:
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as gcloud_firestore
+
+        return gcloud_firestore.Client(project=FIRESTORE_PROJECT_ID, credentials=AnonymousCredentials())
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+class LazyClient:
+    """
+    Firestore client created on first use, so importing this module costs nothing
+    (and no gRPC channel is opened in a gunicorn master before workers fork)
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = self._factory()
+                    print(f"[Firestore] Client initialized in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.client(), name)
+
+
+def create_async_client():
+    """
+    asyncio client for request handlers; shares the firebase app (and credentials) with the sync one
+    """
+    if FIRESTORE_EMULATOR_HOST:
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as gcloud_firestore
+
+        return gcloud_firestore.AsyncClient(project=FIRESTORE_PROJECT_ID, credentials=AnonymousCredentials())
+
+    from firebase_admin import firestore_async
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred)
+    return firestore_async.client()
+
 
-db = firestore.client()
+db = LazyClient(create_client)
+async_db = LazyClient(create_async_client)
 
 from datetime import datetime
 
@@ -38,41 +101,213 @@ def set_last_manual_sync_time(timestamp: datetime):
     }, merge=True)
 
 
-def save_events(events: List[Event]):
-    collection = db.collection("events")
+def get_catalogue_version() -> str | None:
+    """
+    version of the event index built after the last catalogue change (sync, cleanup), shared by all instances
+    """
+    doc = db.collection(SETTINGS_COLLECTION).document(CATALOGUE_DOC_ID).get()
+    return doc.to_dict().get("version") if doc.exists else None
+
+def set_catalogue_version(version: str):
+    db.collection(SETTINGS_COLLECTION).document(CATALOGUE_DOC_ID).set({
+        "version": version,
+        "updated_at": firestore.SERVER_TIMESTAMP,
+    })
+
+
+def get_feature_space_meta() -> dict | None:
+    """
+    {"version", "chunks"} of the feature space shared by all instances, None if it was never saved
+    """
+    doc = db.collection(SETTINGS_COLLECTION).document(FEATURE_SPACE_DOC_ID).get()
+    return doc.to_dict() if doc.exists else None
+
+def load_feature_space_blob(version: str, chunks: int) -> bytes:
+    """
+    serialized feature space of the given version, joined from its chunks
+    """
+    chunks_ref = db.collection(SETTINGS_COLLECTION).document(FEATURE_SPACE_DOC_ID).collection("chunks")
+    refs = [chunks_ref.document(f"{version}-{i}") for i in range(chunks)]
+    docs = {doc.id: doc for doc in db.get_all(refs)}
+    return b"".join(docs[ref.id].to_dict()["data"] for ref in refs)
+
+def save_feature_space_blob(version: str, data: bytes, keep_versions: int = 2):
+    """
+    writes the chunks first and then repoints the feature_space document, so readers never see
+    a partial artifact; chunks of versions older than the last keep_versions are removed
+    """
+    meta_ref = db.collection(SETTINGS_COLLECTION).document(FEATURE_SPACE_DOC_ID)
+    chunks_ref = meta_ref.collection("chunks")
+    chunks = [data[i:i + BLOB_CHUNK_BYTES] for i in range(0, len(data), BLOB_CHUNK_BYTES)]
+    for i, chunk in enumerate(chunks):
+        chunks_ref.document(f"{version}-{i}").set({"version": version, "data": chunk})
+
+    previous = get_feature_space_meta() or {}
+    history = [v for v in previous.get("history", []) if v != version] + [version]
+    history = history[-keep_versions:]
+    meta_ref.set({"version": version, "chunks": len(chunks), "history": history,
+                  "updated_at": firestore.SERVER_TIMESTAMP})
+
+    stale = [doc.reference for doc in chunks_ref.select(["version"]).stream()
+             if doc.to_dict().get("version") not in history]
+    delete_in_batches(stale)
+
+
+def acquire_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    """
+    takes a named lease in SETTINGS_COLLECTION unless another owner holds an unexpired one;
+    the check and the write run in one transaction, so two processes can't both get it
+    """
+    ref = db.collection(SETTINGS_COLLECTION).document(f"lease_{name}")
+
+    @firestore.transactional
+    def take(transaction) -> bool:
+        snapshot = ref.get(transaction=transaction)
+        lease = snapshot.to_dict() if snapshot.exists else {}
+        now = datetime.now(timezone.utc)
+        expires_at = lease.get("expires_at")
+        if lease.get("owner") not in (None, owner) and isinstance(expires_at, datetime) and expires_at > now:
+            return False
+        transaction.set(ref, {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)})
+        return True
+
+    return take(db.transaction())
+
+
+def save_job_status(job_id: str, status: dict):
+    db.collection(SETTINGS_COLLECTION).document(f"job_{job_id}").set(status)
+
 
-    for event in events:
-        doc_ref = collection.document(event.id)
-        doc_ref.set(event.model_dump())
+def get_job_status(job_id: str) -> dict | None:
+    doc = db.collection(SETTINGS_COLLECTION).document(f"job_{job_id}").get()
+    return doc.to_dict() if doc.exists else None
+
+
+def release_lease(name: str, owner: str):
+    ref = db.collection(SETTINGS_COLLECTION).document(f"lease_{name}")
+
+    @firestore.transactional
+    def release(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if snapshot.exists and snapshot.to_dict().get("owner") == owner:
+            transaction.delete(ref)
+
+    release(db.transaction())
+
+
+def save_events(events: List[Event], client=None, batch_size: int = FIRESTORE_BATCH_SIZE,
+                workers: int = FIRESTORE_WRITE_WORKERS) -> Dict[str, List[str]]:
+    """
+    writes events with batched commits (up to batch_size writes each, committed in parallel);
+    a failed chunk is retried with backoff as a whole
+
+    failures are reported per chunk: a batch commit is atomic, so when a chunk still fails after
+    FIRESTORE_MAX_RETRIES none of its events was written and all of its ids are in "failed"
+
+    :param client: Firestore client, defaults to db (an emulator client, or the fake one from
+        services/benchmark_save_events.py to benchmark offline)
+    :return: {"written": [...ids], "failed": [...ids]}
+    """
+    client = client or db
+    collection = client.collection("events")
+    chunks = [events[i:i + batch_size] for i in range(0, len(events), batch_size)]
+
+    def commit_chunk(chunk: List[Event]) -> bool:
+        for attempt in range(FIRESTORE_MAX_RETRIES + 1):
+            try:
+                batch = client.batch()
+                for event in chunk:
+                    batch.set(collection.document(event.id), event.model_dump())
+                batch.commit()
+                return True
+            except Exception as e:
+                if attempt == FIRESTORE_MAX_RETRIES:
+                    print(f"❌ Failed to write batch of {len(chunk)} events: {e}")
+                    return False
+                time.sleep(2 ** attempt)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(commit_chunk, chunks))
+
+    summary = {"written": [], "failed": []}
+    for chunk, ok in zip(chunks, results):
+        summary["written" if ok else "failed"].extend(event.id for event in chunk)
+    return summary
+
+def get_stored_hashes(event_ids: List[str], chunk_size: int = 300) -> Dict[str, str]:
+    """
+    source_hash of already stored events, read in bulk (one get_all per chunk, only that field)
+    """
+    collection = db.collection("events")
+    hashes = {}
+    for i in range(0, len(event_ids), chunk_size):
+        refs = [collection.document(event_id) for event_id in event_ids[i:i + chunk_size]]
+        for doc in db.get_all(refs, field_paths=["source_hash"]):
+            if doc.exists:
+                hashes[doc.id] = (doc.to_dict() or {}).get("source_hash")
+    return hashes
 
 def get_all_events():
     events_ref = db.collection("events")
     return [doc.to_dict() for doc in events_ref.stream()]
 
 
-def delete_expired_events():
-    now = datetime.now()
-    events_ref = db.collection("events")
-    deleted_count = 0
+def count_events() -> int:
+    result = db.collection("events").count().get()
+    return int(result[0][0].value)
+
 
-    for doc in events_ref.stream():
-        event = doc.to_dict()
-        end_time = event.get("endTime")
-        start_time = event.get("startTime")
+def update_event_vectors(events: List[dict], batch_size: int = FIRESTORE_BATCH_SIZE) -> int:
+    """
+    writes component_vectors and vector_version of already stored events in batched commits
 
-        expired = False
-        if isinstance(end_time, datetime):
-            expired = end_time.astimezone().replace(tzinfo=None) < now
-        elif isinstance(start_time, datetime):
-            expired = start_time.astimezone().replace(tzinfo=None) < now
+    :return: count of updated events
+    """
+    updated = 0
+    for i in range(0, len(events), batch_size):
+        batch = db.batch()
+        chunk = [e for e in events[i:i + batch_size] if e.get("id")]
+        for event in chunk:
+            batch.update(db.collection("events").document(event["id"]), {
+                "component_vectors": event["component_vectors"],
+                "vector_version": event["vector_version"],
+            })
+        try:
+            batch.commit()
+            updated += len(chunk)
+        except Exception as e:
+            # напр. подію видалив cleanup; решта батчів пишеться далі, застарілі вектори перепроєктуються знову
+            print(f"[Firestore] ⚠️ Could not update vectors of {len(chunk)} events: {e}")
+    return updated
 
-        if expired:
-            event_id = doc.id
-            success = delete_event_by_id(event_id)
-            if success:
-                deleted_count += 1
 
-    print(f"Deleted {deleted_count} expired events (and removed from favourites).")
+def delete_expired_events(progress: Optional[dict] = None) -> Dict[str, int]:
+    """
+    deletes events that already ended: range query on endTime, and on startTime for events without endTime
+    (the second query needs the composite index on endTime + startTime from firestore.indexes.json)
+
+    :param progress: dict updated with the stage and counters while the cleanup runs
+    :return: {"expired": events found, "deleted": events deleted}
+    """
+    progress = progress if progress is not None else {}
+    progress.update({"stage": "scanning", "expired": 0, "deleted_documents": 0})
+    now = datetime.now(timezone.utc)
+    events_ref = db.collection("events")
+    queries = [
+        events_ref.where(filter=FieldFilter("endTime", "<", now)),
+        events_ref.where(filter=FieldFilter("endTime", "==", None)).where(filter=FieldFilter("startTime", "<", now)),
+    ]
+
+    expired_ids = []
+    for query in queries:
+        for doc in query.select(["id"]).stream():
+            expired_ids.append(doc.id)
+            progress["expired"] = len(expired_ids)
+
+    progress["stage"] = "deleting"
+    deleted_count = delete_events_by_ids(expired_ids, progress)
+    print(f"Deleted {deleted_count} of {len(expired_ids)} expired events (and removed from favourites).")
+    return {"expired": len(expired_ids), "deleted": deleted_count}
 
 
 def delete_event_by_id(event_id: str) -> bool:
@@ -82,17 +317,53 @@ def delete_event_by_id(event_id: str) -> bool:
         print(f"Event {event_id} not found.")
         return False
 
-    doc_ref.delete()
-    print(f"Event {event_id} deleted from events.")
+    delete_events_by_ids([event_id])
+    return True
 
-    users = db.collection("users").stream()
-    for user in users:
-        fav_ref = db.collection("users").document(user.id).collection("favourite_events").document(event_id)
-        if fav_ref.get().exists:
-            fav_ref.delete()
-            print(f"Event {event_id} deleted from user {user.id} favourites.")
 
-    return True
+def delete_events_by_ids(event_ids: List[str], progress: Optional[dict] = None) -> int:
+    """
+    deletes events and their favourite_events entries of all users in batched commits
+
+    :param progress: dict whose "deleted_documents" counter follows the commits
+
+    :return: count of deleted events
+    """
+    if not event_ids:
+        return 0
+
+    favourite_refs = find_favourite_refs(event_ids)
+    event_refs = [db.collection("events").document(event_id) for event_id in event_ids]
+    delete_in_batches(favourite_refs + event_refs, progress=progress)
+
+    print(f"Deleted {len(event_refs)} events and {len(favourite_refs)} favourites entries.")
+    return len(event_refs)
+
+
+def find_favourite_refs(event_ids: List[str]) -> list:
+    """
+    favourite_events documents of any user that point to one of event_ids.
+
+    uses a collection-group query on the `id` field, so only affected users are touched
+    (requires a collection-group index exemption for favourite_events.id)
+    """
+    refs = []
+    for i in range(0, len(event_ids), FIRESTORE_IN_QUERY_LIMIT):
+        chunk = event_ids[i:i + FIRESTORE_IN_QUERY_LIMIT]
+        query = db.collection_group("favourite_events").where(filter=FieldFilter("id", "in", chunk))
+        refs.extend(doc.reference for doc in query.stream())
+    return refs
+
+
+def delete_in_batches(refs: list, batch_size: int = FIRESTORE_BATCH_SIZE, progress: Optional[dict] = None):
+    for i in range(0, len(refs), batch_size):
+        batch = db.batch()
+        chunk = refs[i:i + batch_size]
+        for ref in chunk:
+            batch.delete(ref)
+        batch.commit()
+        if progress is not None:
+            progress["deleted_documents"] = progress.get("deleted_documents", 0) + len(chunk)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from app.config import JOB_LEASE_MINUTES, JOB_WORKERS, JOB_HISTORY_SIZE, JOB_PROGRESS_SECONDS
+from services.firestore_client import acquire_lease, release_lease, save_job_status, get_job_status
+
+# скільки зберігається стан задачі у Firestore (поле expires_at - для TTL-політики колекції)
+JOB_STATUS_TTL = timedelta(days=7)
+
+
+class Job:
+    """
+    one background run of a task; `progress` is filled by the task while it runs
+    """
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.progress: Dict = {}
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    runs long tasks (sync, cleanup) off the request threads.
+
+    at most one job of a kind is active per process; across processes (gunicorn workers, replicas)
+    a Firestore lease per kind, renewed while the job runs, makes a second job of that kind skip.
+    job state is also written to Firestore every progress_seconds, so any worker can report it.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, lease_minutes: int = JOB_LEASE_MINUTES,
+                 history_size: int = JOB_HISTORY_SIZE, progress_seconds: float = JOB_PROGRESS_SECONDS):
+        self.lease_seconds = lease_minutes * 60
+        self.history_size = history_size
+        self.progress_seconds = progress_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._owner_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """
+        state of a job started by this or any other worker
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        status = get_job_status(job_id)
+        if status is not None:
+            status.pop("expires_at", None)
+        return status
+
+    def submit(self, kind: str, task: Callable[[dict], Optional[dict]]) -> Tuple[Job, bool]:
+        """
+        queues task(progress) in the background
+
+        :return: (job, True) or (already active job of this kind, False)
+        """
+        job, created = self._register(kind)
+        if created:
+            self._publish(job)
+            self._executor.submit(self._execute, job, task)
+        return job, created
+
+    def run(self, kind: str, task: Callable[[dict], Optional[dict]]) -> Job:
+        """
+        runs task(progress) in the calling thread (scheduler jobs) under the same guards
+        """
+        job, created = self._register(kind)
+        if created:
+            self._publish(job)
+            self._execute(job, task)
+        return job
+
+    def _register(self, kind: str) -> Tuple[Job, bool]:
+        with self._lock:
+            active = next((job for job in self._jobs.values() if job.kind == kind and job.active), None)
+            if active is not None:
+                return active, False
+            job = Job(kind)
+            self._jobs[job.id] = job
+            # з історії витісняються найстаріші завершені задачі
+            finished = [job_id for job_id, old in self._jobs.items() if not old.active]
+            for job_id in finished[:max(0, len(self._jobs) - self.history_size)]:
+                del self._jobs[job_id]
+            return job, True
+
+    def _execute(self, job: Job, task: Callable[[dict], Optional[dict]]):
+        owner = f"{self._owner_prefix}-{job.id}"
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            leased = acquire_lease(job.kind, owner, self.lease_seconds)
+        except Exception as e:
+            leased = False
+            job.error = f"Could not acquire lease: {e}"
+        if not leased:
+            job.status = "skipped"
+            job.error = job.error or f"Another {job.kind} job is running"
+            job.finished_at = datetime.now(timezone.utc)
+            self._publish(job)
+            print(f"[Jobs] ⏭ {job.kind} {job.id} skipped: {job.error}")
+            return
+
+        job.status = "running"
+        self._publish(job)
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, owner, stop_heartbeat), daemon=True)
+        heartbeat.start()
+
+        print(f"[Jobs] ▶️ {job.kind} {job.id} started.")
+        status = "failed"
+        try:
+            job.result = task(job.progress)
+            status = "succeeded"
+        except Exception as e:
+            job.error = str(e)
+            traceback.print_exc()
+        finally:
+            stop_heartbeat.set()
+            # останній запис стану не має перезаписатись проміжним
+            heartbeat.join()
+            try:
+                release_lease(job.kind, owner)
+            except Exception as e:
+                print(f"[Jobs] ⚠️ Could not release {job.kind} lease: {e}")
+            # статус змінюється після звільнення lease, щоб наступна задача не отримала "skipped"
+            job.finished_at = datetime.now(timezone.utc)
+            job.status = status
+            self._publish(job)
+        print(f"[Jobs] ⏹ {job.kind} {job.id} {job.status}.")
+
+    def _heartbeat(self, job: Job, owner: str, stop: threading.Event):
+        """
+        publishes the job's progress while it runs and renews its lease every third of the lease time
+        """
+        renewed_at = time.monotonic()
+        while not stop.wait(min(self.progress_seconds, self.lease_seconds / 3)):
+            self._publish(job)
+            if time.monotonic() - renewed_at < self.lease_seconds / 3:
+                continue
+            try:
+                acquire_lease(job.kind, owner, self.lease_seconds)
+                renewed_at = time.monotonic()
+            except Exception as e:
+                print(f"[Jobs] ⚠️ Could not renew {job.kind} lease: {e}")
+
+    def _publish(self, job: Job):
+        try:
+            save_job_status(job.id, {**job.to_dict(), "expires_at": job.created_at + JOB_STATUS_TTL})
+        except Exception as e:
+            print(f"[Jobs] ⚠️ Could not store state of {job.kind} {job.id}: {e}")
+
+
+job_manager = JobManager()
@@ -0,0 +1,364 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.config import FETCH_WORKERS, PIPELINE_QUEUE_SIZE, PIPELINE_CATEGORIZE_WORKERS, PIPELINE_TRANSLATE_WORKERS, \
+    PIPELINE_VECTORIZE_WORKERS, PIPELINE_WRITE_BATCH, PIPELINE_FLUSH_SECONDS, PIPELINE_CHECKPOINT_PATH, \
+    PIPELINE_CHECKPOINT_MAX_AGE_HOURS
+from categorization.event_categorization import assign_categories_to_events
+from recommendation.event_index import refresh_event_index
+from recommendation.feature_space import get_feature_space
+from recommendation.vectorizer import generate_events_vectors, ensure_feature_space, \
+    extract_event_fields_for_vectorization, refit_feature_space_if_stale
+from services.fetcher import iter_query_pages, detect_changes
+from services.firestore_client import save_events, get_all_events
+from services.transformers import transform_events
+
+# кінець потоку в черзі між етапами
+STOP = object()
+
+
+def query_key(query: tuple) -> str:
+    name, _, is_virtual = query
+    return f"{name}|{'virtual' if is_virtual else 'offline'}"
+
+
+class Checkpoint:
+    """
+    queries of the current sync whose events are all written, kept in a json file;
+    a sync started within max_age_seconds of an interrupted (not finished) one skips them
+    """
+
+    def __init__(self, path: str, max_age_seconds: float):
+        self.path = path
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.completed = set()
+
+        data = self._read()
+        if data and not data.get("finished") and time.time() - data.get("started_at", 0) < max_age_seconds:
+            self.started_at = data["started_at"]
+            self.completed = set(data.get("completed", []))
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def mark_completed(self, key: str):
+        with self._lock:
+            self.completed.add(key)
+            self._write({"completed": sorted(self.completed)})
+
+    def finish(self, failed: List[str]):
+        """
+        marks the run as finished, so the next sync starts over (and retries the failed queries) instead of resuming
+        """
+        with self._lock:
+            self._write({"completed": sorted(self.completed), "failed": failed, "finished": True})
+
+    def _write(self, data: dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"started_at": self.started_at, **data}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class QueryProgress:
+    """
+    counts pages of every query still in flight; a query is checkpointed once it is fully
+    fetched and every one of its pages reached Firestore without errors
+    """
+
+    def __init__(self, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, int] = {}
+        self._fetched = set()
+        self.failed = set()
+
+    def page_started(self, key: str):
+        with self._lock:
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def page_done(self, key: str, ok: bool = True):
+        with self._lock:
+            self._in_flight[key] -= 1
+            if not ok:
+                self.failed.add(key)
+        self._maybe_complete(key)
+
+    def fetch_done(self, key: str):
+        with self._lock:
+            self._fetched.add(key)
+        self._maybe_complete(key)
+
+    def fetch_failed(self, key: str):
+        with self._lock:
+            self.failed.add(key)
+
+    def retry(self, keys: set):
+        """
+        forgets the state of failed queries before they are fetched again
+        """
+        with self._lock:
+            for key in keys:
+                self._in_flight.pop(key, None)
+                self._fetched.discard(key)
+                self.failed.discard(key)
+
+    def _maybe_complete(self, key: str):
+        with self._lock:
+            done = key in self._fetched and not self._in_flight.get(key) and key not in self.failed
+        if done:
+            try:
+                self.checkpoint.mark_completed(key)
+            except OSError as e:
+                # без чекпойнта запит лише повториться після перерваної синхронізації
+                print(f"[Pipeline] ⚠️ Could not checkpoint {key}: {e}")
+
+
+class SyncPipeline:
+    """
+    fetch → categorize → translate → vectorize → write, connected by bounded queues.
+
+    pages of raw events flow through the stages as units ({"query", "items", ...}), so memory is
+    bounded by the queue sizes; the writer flushes micro-batches of PIPELINE_WRITE_BATCH events
+    (or whatever it has after PIPELINE_FLUSH_SECONDS), so events appear in Firestore while the sync runs.
+    """
+
+    def __init__(self, checkpoint: Checkpoint, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 write_batch: int = PIPELINE_WRITE_BATCH, flush_seconds: float = PIPELINE_FLUSH_SECONDS,
+                 report: Optional[dict] = None):
+        """
+        :param report: dict to keep the counters in, so callers can watch them while the sync runs
+        """
+        self.progress = QueryProgress(checkpoint)
+        self.queue_size = queue_size
+        self.write_batch = write_batch
+        self.flush_seconds = flush_seconds
+        self.report = report if report is not None else {}
+        self.report.update({"fetched": 0, "new": 0, "changed": 0, "unchanged": 0, "written": 0, "failed": 0})
+        self._report_lock = threading.Lock()
+        self._seen = set()
+        self._seen_lock = threading.Lock()
+        self._space_lock = threading.Lock()
+
+    def count(self, **counters: int):
+        with self._report_lock:
+            for name, value in counters.items():
+                self.report[name] += value
+
+    # ---------------- stages
+    def fetch(self, query: tuple, outbox: queue.Queue):
+        key = query_key(query)
+        # помилка запиту доходить до run(), і запит позначається невдалим (і повторюється)
+        for page in iter_query_pages(*query, raise_errors=True):
+            self.count(fetched=len(page))
+            self.progress.page_started(key)
+            outbox.put({"query": key, "items": page})
+        self.progress.fetch_done(key)
+
+    def categorize(self, batch: dict) -> dict:
+        # одна подія приходить з кількох запитів (місто і область) - обробляється лише перший раз
+        with self._seen_lock:
+            fresh = [raw for raw in batch["items"] if raw.get("event_id") and raw["event_id"] not in self._seen]
+            self._seen.update(raw["event_id"] for raw in fresh)
+
+        changes = detect_changes(fresh)
+        self.count(new=len(changes["new"]), changed=len(changes["changed"]), unchanged=changes["unchanged"])
+        pending = changes["new"] + changes["changed"]
+        assign_categories_to_events(pending)
+        return {**batch, "items": pending, "hashes": changes["hashes"]}
+
+    def translate(self, batch: dict) -> dict:
+        events = transform_events(batch["items"])
+        for event in events:
+            event.source_hash = batch["hashes"][event.id]
+        return {**batch, "items": events}
+
+    def vectorize(self, batch: dict) -> dict:
+        if get_feature_space() is None:
+            # перший батч без збереженого простору ознак - його фітить лише один потік
+            with self._space_lock:
+                return {**batch, "items": generate_events_vectors(batch["items"])}
+        return {**batch, "items": generate_events_vectors(batch["items"])}
+
+    def write(self, inbox: queue.Queue):
+        buffer: List[dict] = []
+        last_flush = time.monotonic()
+
+        def flush():
+            events = [event for batch in buffer for event in batch["items"]]
+            try:
+                summary = save_events(events) if events else {"written": [], "failed": []}
+            except Exception as e:
+                print(f"[Pipeline] ❌ write failed: {e}")
+                summary = {"written": [], "failed": [event.id for event in events]}
+            self.count(written=len(summary["written"]), failed=len(summary["failed"]))
+            failed = set(summary["failed"])
+            for batch in buffer:
+                self.page_done(batch["query"], ok=not any(event.id in failed for event in batch["items"]))
+            if events:
+                print(f"[Pipeline] 💾 Wrote {len(summary['written'])} events ({len(failed)} failed).")
+            buffer.clear()
+
+        while True:
+            try:
+                batch = inbox.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                batch = None
+            if batch is STOP:
+                break
+            if batch is not None:
+                buffer.append(batch)
+            buffered = sum(len(b["items"]) for b in buffer)
+            if buffer and (buffered >= self.write_batch or time.monotonic() - last_flush >= self.flush_seconds):
+                flush()
+                last_flush = time.monotonic()
+        flush()
+
+    def page_done(self, key: str, ok: bool = True):
+        try:
+            self.progress.page_done(key, ok=ok)
+        except Exception as e:
+            print(f"[Pipeline] ⚠️ Could not record progress of {key}: {e}")
+
+    # ---------------- wiring
+    def start_stage(self, name: str, worker: Callable[[dict], dict], inbox: queue.Queue, outbox: queue.Queue,
+                    workers: int) -> List[threading.Thread]:
+        """
+        runs worker over every unit of inbox in `workers` threads; a failed unit is dropped and its query
+        left out of the checkpoint, the last thread to stop passes STOP downstream
+        """
+        remaining = [max(1, workers)]
+        lock = threading.Lock()
+
+        def loop():
+            try:
+                while True:
+                    batch = inbox.get()
+                    if batch is STOP:
+                        # для інших потоків цього етапу
+                        inbox.put(STOP)
+                        break
+                    try:
+                        result = worker(batch)
+                    except Exception as e:
+                        print(f"[Pipeline] ❌ {name} failed for {batch['query']}: {e}")
+                        self.page_done(batch["query"], ok=False)
+                        continue
+                    if result["items"]:
+                        outbox.put(result)
+                    else:
+                        self.page_done(batch["query"])
+            finally:
+                # навіть якщо потік впав, наступний етап має отримати STOP, інакше run() чекає вічно
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(STOP)
+
+        threads = [threading.Thread(target=loop, name=f"sync-{name}-{i}") for i in range(remaining[0])]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def retry(self, queries: List[tuple]):
+        """
+        runs the queries again; events seen in the first pass go through change detection again,
+        so the ones already written are skipped as unchanged
+        """
+        self.progress.retry({query_key(query) for query in queries})
+        with self._seen_lock:
+            self._seen.clear()
+        self.run(queries)
+
+    def run(self, queries: List[tuple]):
+        raw, categorized, translated, vectorized = (queue.Queue(maxsize=self.queue_size) for _ in range(4))
+
+        threads = []
+        threads += self.start_stage("categorize", self.categorize, raw, categorized, PIPELINE_CATEGORIZE_WORKERS)
+        threads += self.start_stage("translate", self.translate, categorized, translated, PIPELINE_TRANSLATE_WORKERS)
+        threads += self.start_stage("vectorize", self.vectorize, translated, vectorized, PIPELINE_VECTORIZE_WORKERS)
+        writer = threading.Thread(target=self.write, args=(vectorized,), name="sync-write")
+        writer.start()
+        threads.append(writer)
+
+        try:
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+                futures = [executor.submit(self.fetch, query, raw) for query in queries]
+                for query, future in zip(queries, futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"[Pipeline] ❌ fetch failed for {query_key(query)}: {e}")
+                        self.progress.fetch_failed(query_key(query))
+        finally:
+            raw.put(STOP)
+            for thread in threads:
+                thread.join()
+
+
+def prepare_feature_space():
+    """
+    the feature space is fitted on the stored catalogue before the stream starts, so all
+    micro-batches are vectorized in the same frozen space
+    """
+    if get_feature_space() is not None:
+        return
+    catalogue = get_all_events()
+    if catalogue:
+        ensure_feature_space([extract_event_fields_for_vectorization(e) for e in catalogue])
+
+
+def run_sync_pipeline(queries: List[tuple], checkpoint_path: str = PIPELINE_CHECKPOINT_PATH,
+                      progress: Optional[dict] = None) -> Dict[str, int]:
+    """
+    streams a sync through the pipeline; queries completed by an interrupted run are skipped,
+    queries that failed are retried once at the end
+
+    :param progress: dict updated with the counters while the sync runs
+    :return: counters of fetched/new/changed/unchanged/written/failed events
+    """
+    started = time.perf_counter()
+    checkpoint = Checkpoint(checkpoint_path, PIPELINE_CHECKPOINT_MAX_AGE_HOURS * 3600)
+    pending = [query for query in queries if query_key(query) not in checkpoint.completed]
+    if len(pending) < len(queries):
+        print(f"[Pipeline] ⏩ Resuming sync: {len(queries) - len(pending)} queries already done.")
+
+    prepare_feature_space()
+
+    pipeline = SyncPipeline(checkpoint, report=progress)
+    pipeline.report["resumed_queries"] = len(queries) - len(pending)
+    pipeline.run(pending)
+
+    # запити з помилками - ще один окремий прохід
+    failed = set(pipeline.progress.failed)
+    pipeline.report["retried_queries"] = len(failed)
+    if failed:
+        print(f"[Pipeline] 🔁 Retrying {len(failed)} failed queries.")
+        pipeline.retry([query for query in pending if query_key(query) in failed])
+    checkpoint.finish(sorted(pipeline.progress.failed))
+
+    report = dict(pipeline.report)
+    print(f"[Pipeline] ✅ Sync: {report['new']} new, {report['changed']} changed, {report['unchanged']} unchanged, "
+          f"{report['written']} written, {report['failed']} failed in {time.perf_counter() - started:.0f} s.")
+
+    # перший прохід у порожню базу навчає простір ознак на одному батчі - після синхронізації його
+    # словники перенавчаються на всьому каталозі
+    try:
+        report["feature_space_refitted"] = refit_feature_space_if_stale()
+    except Exception as e:
+        print(f"[Pipeline] ⚠️ Could not refit feature space: {e}")
+
+    refresh_event_index()
+    return report
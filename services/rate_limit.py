@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    thread-safe token bucket: refills `rate` tokens per second up to `capacity`,
+    `acquire` blocks until enough tokens are available
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderLimiter:
+    """
+    limits of one external provider: at most `concurrency` calls in flight and `rate` calls per second.
+    used as a context manager around a single call
+    """
+
+    def __init__(self, concurrency: int, rate: float, capacity: float = None):
+        self._semaphore = threading.BoundedSemaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate, capacity)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        return False
@@ -1,29 +1,38 @@
+from app.config import TRANSFORM_WORKERS, GEMINI_BATCH_EVENTS
 from app.models import Event, Venue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from services.translation_ai import translate_event_fields, translate_event_fields_limited
+from services.translation_ai import translate_event_fields, translate_events_batch
 from services.translation import translate_text, translate_city
 
-def parse_event(raw: dict) -> Event:
-    name_en = raw.get("name", "")
-    description_en = raw.get("description", "")
-    venue_data = raw.get("venue", {})
-    city = venue_data.get("city", "") if venue_data else ""
+def build_translation_input(raw: dict) -> dict:
+    venue_data = raw.get("venue") or {}
 
     # Основні поля для перекладу
-    translation_input = {
-        "name": name_en,
-        "description": description_en,
+    return {
+        "name": raw.get("name", ""),
+        "description": raw.get("description", ""),
         "venue_name": venue_data.get("name", ""),
-        "city": city,
+        "city": venue_data.get("city", ""),
     }
 
-    translated = translate_event_fields_limited(translation_input)
+def parse_event(raw: dict, translated: Optional[dict] = None) -> Event:
+    """
+    :param translated: already translated fields (batch mode); translated one by one if omitted
+    """
+    name_en = raw.get("name", "")
+    description_en = raw.get("description", "")
+    venue_data = raw.get("venue", {})
+    city = venue_data.get("city", "") if venue_data else ""
+
+    if translated is None:
+        translated = translate_event_fields(build_translation_input(raw))
 
-    name_uk = translated.get("name") or translate_text(name_en)
-    description_uk = translated.get("description") or translate_text(description_en) if description_en else None
-    venue_name_uk = translated.get("venue_name") or translate_text(venue_data.get("name", "")) if venue_data else ""
+    name_uk = translated.get("name") or translate_text(name_en, kind="name")
+    description_uk = translated.get("description") or translate_text(description_en, kind="description") if description_en else None
+    venue_name_uk = translated.get("venue_name") or translate_text(venue_data.get("name", ""), kind="venue_name") if venue_data else ""
     city_uk = translated.get("city") or translate_city(city) if city else ""
 
     venue = None
@@ -74,8 +83,35 @@ def parse_event(raw: dict) -> Event:
         price="-"
     )
 
-def transform_events(raw_data: List[dict]) -> List[Event]:
-    return [parse_event(event) for event in raw_data]
+def transform_events(raw_data: List[dict], workers: int = TRANSFORM_WORKERS) -> List[Event]:
+    """
+    translates and parses events in a thread pool: Gemini prompts cover chunks of GEMINI_BATCH_EVENTS
+    events, fallbacks run per event; Gemini and deep_translator calls are throttled by their own limiters.
+    keeps the input order, an event that fails is logged and left out
+    """
+    inputs = [build_translation_input(event) for event in raw_data]
+    chunks = [list(range(i, min(i + GEMINI_BATCH_EVENTS, len(raw_data))))
+              for i in range(0, len(raw_data), GEMINI_BATCH_EVENTS)]
+
+    def translate_chunk(chunk):
+        try:
+            return translate_events_batch([inputs[i] for i in chunk])
+        except Exception as e:
+            # parse_event перекладе поля по одному
+            print(f"❌ Batch translation failed for {len(chunk)} events: {e}")
+            return [{} for _ in chunk]
+
+    def parse(position):
+        try:
+            return parse_event(raw_data[position], translations[position])
+        except Exception as e:
+            print(f"❌ Failed to parse event {raw_data[position].get('event_id')}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        translations = [t for chunk_translations in executor.map(translate_chunk, chunks) for t in chunk_translations]
+        events = list(executor.map(parse, range(len(raw_data))))
+    return [event for event in events if event is not None]
 
 if __name__ == "__main__":
     parsed_events = transform_events([{
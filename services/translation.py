@@ -10,35 +10,40 @@
 #     except Exception as e:
 #         print(f"Translation error: {e}")
 #         return text
-import re
-
 from deep_translator import GoogleTranslator
-from app.config import city_translation_map
+from services.city_localization import city_localizer
+from services.translation_cache import translation_cache
+from services.rate_limit import ProviderLimiter
+from app.config import TRANSLATOR_CONCURRENCY, TRANSLATOR_REQUESTS_PER_SECOND
+
+# спільні для всіх потоків ліміти deep_translator
+translator_limiter = ProviderLimiter(TRANSLATOR_CONCURRENCY, TRANSLATOR_REQUESTS_PER_SECOND)
 
 
 def replace_cities_in_text(text: str) -> str:
+    return city_localizer.replace(text)
+
+def translate_text(text: str, kind: str = "text") -> str:
     if not text:
         return text
 
-    # Створюємо регулярний вираз, що матиме всі ключі
-    pattern = r'\b(' + '|'.join(re.escape(city) for city in city_translation_map.keys()) + r')\b'
+    cached = translation_cache.get(text, kind)
+    if cached is not None:
+        return cached
 
-    def replacer(match):
-        city_en = match.group(0)
-        return translate_city(city_en)
-
-    return re.sub(pattern, replacer, text)
-
-def translate_text(text: str) -> str:
     try:
-        translated = GoogleTranslator(source="en", target="uk").translate(text)
-        return replace_cities_in_text(translated)
+        with translator_limiter:
+            translated = GoogleTranslator(source="en", target="uk").translate(text)
+        result = replace_cities_in_text(translated)
     except Exception as e:
         print(f"Translation error: {e}")
         return text
 
+    translation_cache.set(text, kind, result)
+    return result
+
 def translate_city(city: str) -> str:
-    return city_translation_map.get(city.strip(), city)
+    return city_localizer.translate_city(city)
 
 
 
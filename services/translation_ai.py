@@ -1,38 +1,23 @@
+import json
 import re
-import time
+from typing import Dict, List, Tuple
 
-from deep_translator import GoogleTranslator
-from app.config import city_translation_map, GEMINI_API_KEY
+from app.config import GEMINI_API_KEY, GEMINI_REQUESTS_PER_MIN, GEMINI_BATCH_EVENTS, \
+    GEMINI_BATCH_MAX_CHARS, GEMINI_CONCURRENCY
+from services.rate_limit import ProviderLimiter
+from services.translation import translate_text
+from services.translation_cache import translation_cache
 import requests
 
-REQUESTS_PER_MIN = 15
-SECONDS_BETWEEN_REQUESTS = 60 / REQUESTS_PER_MIN
+REQUESTS_PER_MIN = GEMINI_REQUESTS_PER_MIN
+# запит тримає слот конкурентності, тож не може висіти безкінечно
+REQUEST_TIMEOUT_SECONDS = 60
 
-def replace_cities_in_text(text: str) -> str:
-    if not text:
-        return text
+# спільні ліміти запитів до Gemini (частота і одночасні запити) замість фіксованої паузи після кожного запиту
+gemini_limiter = ProviderLimiter(GEMINI_CONCURRENCY, REQUESTS_PER_MIN / 60, capacity=1)
 
-    pattern = r'\b(' + '|'.join(re.escape(city) for city in city_translation_map.keys()) + r')\b'
 
-    def replacer(match):
-        city_en = match.group(0)
-        return translate_city(city_en)
-
-    return re.sub(pattern, replacer, text)
-
-def translate_text(text: str) -> str:
-    try:
-        translated = GoogleTranslator(source="en", target="uk").translate(text)
-        return replace_cities_in_text(translated)
-    except Exception as e:
-        print(f"Translation error: {e}")
-        return text
-
-def translate_city(city: str) -> str:
-    return city_translation_map.get(city.strip(), city)
-
-
-def translate_with_gemini(prompt_text: str) -> str:
+def translate_with_gemini(prompt_text: str, json_output: bool = False) -> str:
     url = (
         f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
         f"?key={GEMINI_API_KEY}"
@@ -46,9 +31,12 @@ def translate_with_gemini(prompt_text: str) -> str:
             }
         ]
     }
+    if json_output:
+        payload["generationConfig"] = {"responseMimeType": "application/json"}
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        with gemini_limiter:
+            response = requests.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
         response.raise_for_status()
         result = response.json()
         return result["candidates"][0]["content"]["parts"][0]["text"].strip()
@@ -76,50 +64,152 @@ def build_translation_prompt(event_id: str, texts: dict) -> str:
     )
 
 
-def translate_event_fields_limited(data):
-    translated = translate_event_fields(data)
-    time.sleep(SECONDS_BETWEEN_REQUESTS)
-    return translated
+def build_batch_translation_prompt(items: Dict[str, str]) -> str:
+    return (
+        "Translate each value of the JSON object below to Ukrainian. "
+        "If a value is written in Latin letters (transliterated Ukrainian), convert it to proper Ukrainian Cyrillic. "
+        "If a value is already in Ukrainian or written in Cyrillic, leave it unchanged. "
+        "Return a JSON object with exactly the same keys and the translated values. "
+        "Do not add any comments or extra text.\n\n"
+        f"{json.dumps(items, ensure_ascii=False, indent=0)}"
+    )
 
-def translate_event_fields(event: dict) -> dict:
-    fields = {
+
+def parse_batch_translation(text: str, expected_keys) -> Dict[str, str]:
+    """
+    reads a batch response back: JSON object first (optionally in a code fence), 'key: value' lines otherwise;
+    only expected keys with non-empty string values are kept
+    """
+    expected_keys = set(expected_keys)
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+
+    try:
+        data = json.loads(cleaned)
+    except ValueError:
+        data = {}
+        for line in cleaned.splitlines():
+            if ':' in line:
+                key, val = line.split(':', 1)
+                data[key.strip().strip('"')] = val.strip().rstrip(',').strip('"')
+
+    if not isinstance(data, dict):
+        return {}
+    return {
+        key: val.strip() for key, val in data.items()
+        if key in expected_keys and isinstance(val, str) and val.strip()
+    }
+
+
+def event_translation_fields(event: dict) -> Dict[str, str]:
+    venue = event.get("venue") or {}
+    return {
         "name": str(event.get("name") or ""),
         "description": str(event.get("description") or ""),
-        "venue_name": str(event.get("venue", {}).get("name") or ""),
-        "city": str(event.get("venue", {}).get("city") or ""),
+        "venue_name": str(event.get("venue_name") or venue.get("name") or ""),
+        "city": str(event.get("city") or venue.get("city") or ""),
     }
 
-    prompt = build_translation_prompt(event.get("id", ""), fields)
+
+def chunk_pending_events(pending: Dict[int, Dict[str, str]]) -> List[List[int]]:
+    """
+    groups event positions into prompts of at most GEMINI_BATCH_EVENTS events / GEMINI_BATCH_MAX_CHARS characters
+    """
+    chunks = []
+    current, size = [], 0
+    for i, fields in pending.items():
+        event_size = sum(len(v) for v in fields.values())
+        if current and (len(current) >= GEMINI_BATCH_EVENTS or size + event_size > GEMINI_BATCH_MAX_CHARS):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += event_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def translate_events_batch(events: List[dict]) -> List[dict]:
+    """
+    translates fields of many events with one Gemini prompt per chunk of events.
+    values are keyed as '<position>.<field>'; keys missing in the response fall back to deep_translator.
+    """
+    fields = [event_translation_fields(event) for event in events]
+    cached = translation_cache.get_many({(val, key) for f in fields for key, val in f.items() if val})
+
+    results = [{key: cached.get((val, key), "") for key, val in f.items()} for f in fields]
+    pending = {}
+    for i, f in enumerate(fields):
+        event_pending = {key: val for key, val in f.items() if val and (val, key) not in cached}
+        if event_pending:
+            pending[i] = event_pending
+
+    for chunk in chunk_pending_events(pending):
+        items = {f"{i}.{key}": val for i in chunk for key, val in pending[i].items()}
+        translated_text = translate_with_gemini(build_batch_translation_prompt(items), json_output=True)
+        parsed = parse_batch_translation(translated_text, items.keys()) if translated_text else {}
+
+        new_translations = {}
+        for item_key, val in parsed.items():
+            position, key = item_key.split(".", 1)
+            results[int(position)][key] = val
+            new_translations[(items[item_key], key)] = val
+        translation_cache.set_many(new_translations)
+
+        # deep_translator сам кешує успішні переклади
+        missing = [item_key for item_key in items if item_key not in parsed]
+        if missing:
+            print(f"⚠️ {len(missing)} of {len(items)} values missing in Gemini batch response, using deep_translator")
+        for item_key in missing:
+            position, key = item_key.split(".", 1)
+            results[int(position)][key] = translate_text(items[item_key], kind=key)
+
+    return results
+
+
+def translate_event_fields(event: dict) -> dict:
+    return translate_event_fields_cached(event)[0]
+
+def translate_event_fields_cached(event: dict) -> Tuple[dict, bool]:
+    """
+    translates event fields, taking already known translations from the cache;
+    only uncached fields are sent to Gemini
+
+    :return: (translated fields, whether Gemini was called)
+    """
+    fields = event_translation_fields(event)
+
+    cached = translation_cache.get_many([(val, key) for key, val in fields.items() if val])
+    result = {key: cached.get((val, key), "") for key, val in fields.items()}
+    pending = {key: val for key, val in fields.items() if val and (val, key) not in cached}
+    if not pending:
+        return result, False
+
+    prompt = build_translation_prompt(event.get("id", ""), pending)
     translated_text = translate_with_gemini(prompt)
 
     if not translated_text:
         # Gemini fallback: deep_translator
         print("⚠️ Gemini failed, falling back to deep_translator")
-        fallback_result = {}
-        for key, val in fields.items():
-            if val:
-                fallback_result[key] = translate_text(val)
-            else:
-                fallback_result[key] = ""
-        return fallback_result
-
-    lines = translated_text.splitlines()
-    result = {}
-    for line in lines:
+        for key, val in pending.items():
+            result[key] = translate_text(val, kind=key)
+        return result, True
+
+    parsed = {}
+    for line in translated_text.splitlines():
         if ':' in line:
             key, val = line.split(':', 1)
-            result[key.strip()] = val.strip()
+            if key.strip() in pending:
+                parsed[key.strip()] = val.strip()
 
-    missing = set(fields.keys()) - set(result.keys())
+    missing = set(pending.keys()) - set(parsed.keys())
     if missing:
         print(f"⚠️ Missing keys in Gemini translation response: {missing}")
         for key in missing:
-            if fields[key]:
-                result[key] = translate_text(fields[key])
-            else:
-                result[key] = ""
+            parsed[key] = translate_text(pending[key], kind=key)
 
-    return result
+    translation_cache.set_many({(pending[key], key): val for key, val in parsed.items() if val})
+    result.update(parsed)
+    return result, True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.config import TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_TTL_DAYS, TRANSLATION_CACHE_MAX_ENTRIES
+
+# як часто (у кількості записів) перевіряти розмір кешу
+EVICT_EVERY_WRITES = 500
+
+
+class TranslationCache:
+    """
+    persistent translation cache in a local SQLite file, keyed by (source text, field kind, target language).
+    entries expire after `ttl_seconds`; above `max_entries` the least recently used ones are evicted.
+
+    the connection is opened on first use in each process: SQLite connections must not cross a fork
+    (gunicorn imports the app in the master before forking workers).
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        connection of the current process; call under _lock
+        """
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # з'єднання батьківського процесу не закривається - воно йому й належить
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS translations ("
+                    " source TEXT NOT NULL, kind TEXT NOT NULL, lang TEXT NOT NULL,"
+                    " translated TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                    " PRIMARY KEY (source, kind, lang))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS translations_accessed ON translations (accessed_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, source: str, kind: str, lang: str = "uk") -> Optional[str]:
+        return self.get_many([(source, kind)], lang).get((source, kind))
+
+    def get_many(self, keys: Iterable[Tuple[str, str]], lang: str = "uk") -> Dict[Tuple[str, str], str]:
+        """
+        cached translations for (source, kind) pairs; missing or expired keys are absent from the result
+        """
+        now = time.time()
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for source, kind in keys:
+                    row = conn.execute(
+                        "SELECT translated, created_at FROM translations WHERE source = ? AND kind = ? AND lang = ?",
+                        (source, kind, lang),
+                    ).fetchone()
+                    if row is None or now - row[1] > self.ttl_seconds:
+                        continue
+                    found[(source, kind)] = row[0]
+                    conn.execute(
+                        "UPDATE translations SET accessed_at = ? WHERE source = ? AND kind = ? AND lang = ?",
+                        (now, source, kind, lang),
+                    )
+        return found
+
+    def set(self, source: str, kind: str, translated: str, lang: str = "uk"):
+        self.set_many({(source, kind): translated}, lang)
+
+    def set_many(self, translations: Dict[Tuple[str, str], str], lang: str = "uk"):
+        if not translations:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO translations (source, kind, lang, translated, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(source, kind, lang, translated, now, now) for (source, kind), translated in translations.items()],
+                )
+                self._writes += len(translations)
+                if self._writes >= EVICT_EVERY_WRITES:
+                    self._writes = 0
+                    self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM translations WHERE rowid IN ("
+            " SELECT rowid FROM translations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+translation_cache = TranslationCache(
+    TRANSLATION_CACHE_PATH,
+    ttl_seconds=TRANSLATION_CACHE_TTL_DAYS * 24 * 3600,
+    max_entries=TRANSLATION_CACHE_MAX_ENTRIES,
+)